@@ -4,26 +4,43 @@ Migrated from photoapp.py get_bucket and get_rekognition logic
 """
 
 import boto3
+import functools
 import logging
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from config import settings
 
 
-def get_bucket():
+# Shared settings for S3 uploads/downloads: 8 MB multipart parts with up to
+# 16 parts in flight (within the client's 50-connection pool)
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True
+)
+
+
+# Name of the bucket every S3 call targets
+S3_BUCKET_NAME = settings.s3_bucket_name
+
+
+@functools.lru_cache(maxsize=1)
+def get_s3():
     """
-    Creates and returns S3 bucket object based on configuration.
-    You should call close() on the object when you are done.
-    
-    This function preserves the exact logic from the original photoapp.py
+    Creates and returns S3 client object based on configuration.
+    The client is built once and shared by every request (boto3 clients
+    are thread-safe, unlike resources such as s3.Bucket), so callers
+    must NOT call close() on it. Pass Bucket=S3_BUCKET_NAME to each call.
     
     Returns:
-        S3 bucket object
+        S3 client object
     
     Raises:
-        Exception: If bucket access fails
+        Exception: If client creation fails
     """
     try:
-        s3 = boto3.resource(
+        s3 = boto3.client(
             's3',
             region_name=settings.s3_region,
             aws_access_key_id=settings.s3_readwrite_access_key,
@@ -32,23 +49,26 @@ def get_bucket():
                 retries={
                     'max_attempts': 3,
                     'mode': 'standard'
-                }
+                },
+                max_pool_connections=50,
+                tcp_keepalive=True
             )
         )
         
-        bucket = s3.Bucket(settings.s3_bucket_name)
-        return bucket
+        return s3
     
     except Exception as err:
-        logging.error("get_bucket():")
+        logging.error("get_s3():")
         logging.error(str(err))
         raise
 
 
+@functools.lru_cache(maxsize=1)
 def get_rekognition():
     """
     Creates and returns Rekognition client object based on configuration.
-    You should call close() on the object when you are done.
+    The client is built once and shared by every request (boto3 clients
+    are thread-safe), so callers must NOT call close() on it.
     
     This function preserves the exact logic from the original photoapp.py
     
@@ -68,7 +88,9 @@ def get_rekognition():
                 retries={
                     'max_attempts': 3,
                     'mode': 'standard'
-                }
+                },
+                max_pool_connections=50,
+                tcp_keepalive=True
             )
         )
         
@@ -23,6 +23,7 @@ class Settings(BaseSettings):
     rds_username: str = Field(..., alias="RDS_USERNAME")
     rds_password: str = Field(..., alias="RDS_PASSWORD")
     rds_database: str = Field(..., alias="RDS_DATABASE")
+    rds_pool_size: int = Field(10, alias="RDS_POOL_SIZE")
     
     # S3 settings
     s3_bucket_name: str = Field(..., alias="S3_BUCKET_NAME")
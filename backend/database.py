@@ -5,33 +5,67 @@ Migrated from photoapp.py get_dbConn logic
 
 import pymysql
 import logging
+import threading
 from contextlib import contextmanager
+from dbutils.pooled_db import PooledDB
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from config import settings
 
 
+_pool = None
+_pool_lock = threading.Lock()
+
+# Retry policy shared by the routes' database helpers: dropped or refused
+# connections are retried with backoff, while deterministic failures such
+# as a missing row are raised straight away
+db_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=30),
+    retry=retry_if_exception_type((pymysql.err.OperationalError, pymysql.err.InterfaceError)),
+    reraise=True
+)
+
+
+def _get_pool():
+    """
+    Returns the shared connection pool, creating it on first use.
+    Creation is deferred so importing this module never touches the database.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PooledDB(
+                    creator=pymysql,
+                    maxconnections=settings.rds_pool_size,
+                    mincached=2,
+                    blocking=True,
+                    ping=1,  # check each connection as it is checked out
+                    host=settings.rds_endpoint,
+                    port=settings.rds_port,
+                    user=settings.rds_username,
+                    passwd=settings.rds_password,
+                    database=settings.rds_database
+                )
+    return _pool
+
+
 def get_dbConn():
     """
-    Creates and returns a pymysql connection object based on configuration.
-    You should call close() on the object when you are done.
+    Returns a pymysql connection checked out of the shared pool.
+    You should call close() on the object when you are done;
+    this returns the connection to the pool rather than closing it.
     
-    This function preserves the exact logic from the original photoapp.py
+    Connection settings are the same as in the original photoapp.py
     
     Returns:
-        pymysql connection object
+        pooled pymysql connection object
     
     Raises:
         Exception: If connection fails
     """
     try:
-        dbConn = pymysql.connect(
-            host=settings.rds_endpoint,
-            port=settings.rds_port,
-            user=settings.rds_username,
-            passwd=settings.rds_password,
-            database=settings.rds_database,
-            # Allow execution of a query string with multiple SQL queries
-            client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS
-        )
+        dbConn = _get_pool().connection()
         return dbConn
     
     except Exception as err:
@@ -71,3 +105,20 @@ def get_db_cursor():
                 dbConn.close()
             except:
                 pass
+
+
+def get_db():
+    """
+    FastAPI dependency that checks a connection out of the pool for the
+    duration of a request and returns it once the response is sent.
+    
+    Usage:
+        @router.get("/example")
+        def example(db = Depends(get_db)):
+            dbConn, dbCursor = db
+    
+    Yields:
+        tuple: (connection, cursor)
+    """
+    with get_db_cursor() as (dbConn, dbCursor):
+        yield dbConn, dbCursor
@@ -5,15 +5,62 @@ Definition of an Image class for storing and manipulating single images
 """
 
 from .pixel import Pixel
-import io, requests
+import functools
+import numpy as np
 from PIL import Image as PILImage
 
+
+_SEPIA = np.array([
+    [393, 769, 189],
+    [349, 686, 168],
+    [272, 534, 131],
+], dtype=np.int32)
+"""
+The sepia color matrix in thousandths: each output channel is
+  (row . [red, green, blue]) // 1000, rounded down and clamped to 255
+"""
+
+
+def _add_saturating(data : np.ndarray, amount : int):
+    """
+    Adds 'amount' to every element of the uint8 array 'data' in place,
+      clamping the results to [0, 255] without any wider temporaries
+
+    Values that would overflow are first lowered (or raised) to the
+      point where the add lands exactly on the boundary
+    """
+    if amount >= 0:
+        amount = min(amount, 255)
+        np.minimum(data, 255 - amount, out=data)
+        data += amount
+    else:
+        amount = min(-amount, 255)
+        np.maximum(data, amount, out=data)
+        data -= amount
+
+
+@functools.lru_cache(maxsize=64)
+def _brightness_lut(amount : float) -> np.ndarray:
+    """
+    Returns a 256-entry uint8 lookup table mapping each component value v
+      to clamp(v * amount) truncated to an integer
+
+    Tables are cached by amount, so repeated brightness edits only
+      pay for a single table lookup per component
+    """
+    lut = np.clip(np.arange(256, dtype=np.uint8) * amount, 0, 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
 class Image:
-    _data : list[list[Pixel]]
+    _data : np.ndarray
     """
     The core pixel data contained in this Image
-    
-    Every row in _data must be the same length, and no row can have a zero length
+
+    _data is a (height, width, 3) uint8 ndarray of RGB components
+    Row 0 is the top row of the image (upper-left origin, as in PIL)
+
+    Neither the height nor the width of _data can be zero
     """
 
     _resolution : list[int]
@@ -24,25 +71,37 @@ class Image:
     The length of _resolution must be 2 ([width and height])
     """
 
-    def __init__(self, image : list[list[Pixel]], resolution : list[int]):
+    def __init__(self, image : np.ndarray | list[list[Pixel]], resolution : list[int]):
         """
-        Initializes this Image with the given matrix of Pixels
+        Initializes this Image with the given pixel data
           and resolution (the latter is necessary for BMP metedata)
 
-        Image must be a list of list of Pixels
+        Image must either be a (height, width, 3) uint8 ndarray
+          or a list of list of Pixels, which is converted once on entry
           each row of the image must be of the same length
           neither the image nor any row may be of length 0
 
         resolution is a list consisting of exactly two integers
         """
-        assert type(image) == list
-        assert len(image) > 0
-        for row in image:
-            assert type(row) == list
-            assert len(row) > 0
-            assert len(row) == len(image[0])
-            for pixel in row:
-                assert type(pixel) == Pixel
+        if type(image) == list:
+            assert len(image) > 0
+            for row in image:
+                assert type(row) == list
+                assert len(row) > 0
+                assert len(row) == len(image[0])
+                for pixel in row:
+                    assert type(pixel) == Pixel
+            image = np.array(
+                [[(p._red, p._green, p._blue) for p in row] for row in image],
+                dtype=np.uint8
+            )
+
+        assert isinstance(image, np.ndarray)
+        assert image.dtype == np.uint8
+        assert image.ndim == 3
+        assert image.shape[0] > 0
+        assert image.shape[1] > 0
+        assert image.shape[2] == 3
 
         assert type(resolution) == list
         assert len(resolution) == 2
@@ -60,7 +119,7 @@ class Image:
 
         Uses the size of _data rather than the _resolution of this image
         """
-        return f"{len(self._data)}x{len(self._data[0])} Image"
+        return f"{self._data.shape[0]}x{self._data.shape[1]} Image"
 
 
     def __repr__(self) -> str:
@@ -69,46 +128,39 @@ class Image:
         Includes both the raw data matrix and the resolution of this Image
           (Hint: don't overthink this method, it should be simple)
         """
-        return f"Image({self._data}, {self._resolution})"
+        return f"Image({self._data!r}, {self._resolution})"
+
+
+    @property
+    def _planes(self) -> np.ndarray:
+        """
+        A zero-copy (3, height, width) view of _data, one plane per channel
+
+        Writes through the view modify this Image, so the channel-only
+          operations can work on a single plane at a time
+        """
+        return self._data.transpose(2, 0, 1)
     
     
     def resize(self, new_width: int, new_height: int):
         """
-        Resize the image to new dimensions using nearest neighbor sampling.
+        Resize the image to new dimensions using Lanczos resampling.
         """
         if new_width < 1 or new_height < 1:
             raise ValueError("Width and height must be at least 1")
 
-        old_height = len(self._data)
-        old_width = len(self._data[0])
-
-        pil_img = PILImage.new("RGB", (old_width, old_height))
-        for r in range(old_height):
-            for c in range(old_width):
-                p = self._data[old_height - 1 - r][c]
-                pil_img.putpixel((c, r), (p._red, p._green, p._blue))
-
+        pil_img = PILImage.fromarray(np.ascontiguousarray(self._data))
         resized_pil = pil_img.resize((new_width, new_height), PILImage.LANCZOS)
-
-        new_data: list[list[Pixel]] = []
-        for rr in range(new_height):
-            y = new_height - 1 - rr
-            row: list[Pixel] = []
-            for x in range(new_width):
-                r8, g8, b8 = resized_pil.getpixel((x, y))
-                row.append(Pixel(int(r8), int(g8), int(b8)))
-            new_data.append(row)
-
-        self._data = new_data
+        self._data = np.array(resized_pil)
 
 
     def add_color(self, add_color : Pixel):
         """
         Adds the given Pixel "add_color" to each Pixel in this Image 
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                self._data[r][c] = self._data[r][c] + add_color
+        delta = np.array([add_color._red, add_color._green, add_color._blue], dtype=np.uint8)
+        np.minimum(self._data, 255 - delta, out=self._data)
+        self._data += delta
    
 
     def red_shift(self, amount : float):
@@ -116,10 +168,7 @@ class Image:
         Adds 'amount' to the red component of each Pixel in this Image
         amount must be an integer >= 0
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                pixel = self._data[r][c]
-                self._data[r][c] = Pixel(pixel._red + int(amount), pixel._green, pixel._blue)
+        _add_saturating(self._planes[0], int(amount))
 
 
     def green_shift(self, amount: float):
@@ -127,10 +176,7 @@ class Image:
         Adds 'amount' to the green component of each Pixel in this Image
         amount must be an integer >= 0
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                pixel = self._data[r][c]
-                self._data[r][c] = Pixel(pixel._red, pixel._green + int(amount), pixel._blue)
+        _add_saturating(self._planes[1], int(amount))
 
 
     def blue_shift(self, amount: float):
@@ -138,10 +184,7 @@ class Image:
         Adds 'amount' to the blue component of each Pixel in this Image
         amount must be an integer >= 0
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                pixel = self._data[r][c]
-                self._data[r][c] = Pixel(pixel._red, pixel._green, pixel._blue + int(amount))
+        _add_saturating(self._planes[2], int(amount))
 
 
     def shift_brightness(self, amount : float):
@@ -154,9 +197,7 @@ class Image:
         If amount is greater than 1, the image is brightened
           while if the amount is between 0 and 1, the image is darkened
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                self._data[r][c] = self._data[r][c] * amount
+        self._data = _brightness_lut(float(amount))[self._data]
 
     
     def make_monochrome(self):
@@ -170,31 +211,27 @@ class Image:
         We then update the pixel such that each red, green, and blue
           component contains exactly "average"
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                p = self._data[r][c]
-                avg = (p._red + p._green + p._blue) // 3
-                self._data[r][c] = Pixel(avg, avg, avg)
+        total = self._data.sum(axis=2, dtype=np.uint16)
+        total //= 3
+        self._data[...] = total[..., None]
 
 
     def mirror_horizontal(self):
         """
         Modifies this Image by mirroring it over the x-axis
-        """
 
-        rows = len(self._data)
-        for i in range(rows // 2):
-            self._data[i], self._data[rows - 1 - i] = self._data[rows - 1 - i], self._data[i]
+        This only reverses the row stride of _data, no pixels are copied
+        """
+        self._data = self._data[::-1]
 
 
     def mirror_vertical(self):
         """
         Modifies this Image by mirroring it over the y-axis
+
+        This only reverses the column stride of _data, no pixels are copied
         """
-        cols = len(self._data[0])
-        for row in self._data:
-            for i in range(cols // 2):
-                row[i], row[cols - 1 - i] = row[cols - 1 - i], row[i]
+        self._data = self._data[:, ::-1]
 
 
     def tile(self, size : int):
@@ -214,14 +251,14 @@ class Image:
           1 1 0 0 1
           1 1 0 0 1
         """
-        for r in range(len(self._data)):
-            for c in range(len(self._data[0])):
-                tile_row = (r // size)
-                tile_col = (c // size)
-                if (tile_row + tile_col) % 2 == 0:
-                    self._data[r][c] = self._data[r][c] * 0.5
-                else:
-                    self._data[r][c] = self._data[r][c] * 2.0
+        rows, cols = self._data.shape[:2]
+        tile_rows, tile_cols = np.ogrid[:rows, :cols]
+        # Tiles are laid out from the bottom row up, so count rows from the bottom
+        brighten = (((rows - 1 - tile_rows) // size) + (tile_cols // size)) & 1
+        factor = np.where(brighten, 2.0, 0.5).astype(np.float32)
+
+        scaled = self._data * factor[..., None]
+        self._data = np.minimum(scaled, 255).astype(np.uint8)
 
 
     def blur(self):
@@ -235,51 +272,39 @@ class Image:
 
         If the average value of a Pixel is not an integer, it should be rounded down
         """
-        rows = len(self._data)
-        cols = len(self._data[0])
-        new_data = []
-
-        for r in range(rows):
-            new_row = []
-            for c in range(cols):
-                red = 0
-                green = 0
-                blue = 0
-                count = 0
-                for cr in [-1, 0, 1]:
-                    for cc in [-1, 0, 1]:
-                        nr, nc = r + cr, c + cc
-                        if 0 <= nr < rows and 0 <= nc < cols:
-                            p = self._data[nr][nc]
-                            red += p._red
-                            green += p._green
-                            blue += p._blue
-                            count += 1
-                new_row.append(Pixel(red // count, green // count, blue // count))
-            new_data.append(new_row)
-
-        self._data = new_data
+        rows, cols = self._data.shape[:2]
+
+        # The 3x3 box sum is separable: sum each column window, then each row window
+        column_sums = self._data.astype(np.uint16)
+        column_sums[1:] += self._data[:-1]
+        column_sums[:-1] += self._data[1:]
+
+        sums = column_sums.copy()
+        sums[:, 1:] += column_sums[:, :-1]
+        sums[:, :-1] += column_sums[:, 1:]
+
+        # Edge pixels have fewer neighbors, and the count is separable too
+        row_counts = np.full(rows, 3, dtype=np.uint16)
+        row_counts[0] -= 1
+        row_counts[-1] -= 1
+        col_counts = np.full(cols, 3, dtype=np.uint16)
+        col_counts[0] -= 1
+        col_counts[-1] -= 1
+        counts = row_counts[:, None] * col_counts[None, :]
+
+        sums //= counts[..., None]
+        self._data = sums.astype(np.uint8)
 
 
     def negative(self):
-        """Invert colors (photo negative)."""
-        rows, cols = len(self._data), len(self._data[0])
-        for r in range(rows):
-            for c in range(cols):
-                p = self._data[r][c]
-                self._data[r][c] = Pixel(255 - p._red, 255 - p._green, 255 - p._blue)
+        """Invert colors (photo negative). For uint8, 255 - c is just ~c."""
+        np.invert(self._data, out=self._data)
 
 
     def sepia(self):
         """Classic sepia tone."""
-        rows, cols = len(self._data), len(self._data[0])
-        for r in range(rows):
-            for c in range(cols):
-                p = self._data[r][c]
-                tr = 0.393 * p._red + 0.769 * p._green + 0.189 * p._blue
-                tg = 0.349 * p._red + 0.686 * p._green + 0.168 * p._blue
-                tb = 0.272 * p._red + 0.534 * p._green + 0.131 * p._blue
-                self._data[r][c] = Pixel(int(tr), int(tg), int(tb))
+        toned = (self._data.astype(np.int32) @ _SEPIA.T) // 1000
+        self._data = np.minimum(toned, 255).astype(np.uint8)
 
 
     def rotate(self, degrees: int):
@@ -294,20 +319,12 @@ class Image:
         if degrees % 90 != 0:
             raise ValueError("Rotation only supports multiples of 90 degrees")
 
-        steps_cw = (-degrees // 90) % 4  
+        steps_cw = (degrees // 90) % 4
 
         if steps_cw == 0:
             return  
 
-        def rot90(data):
-            r, c = len(data), len(data[0])
-            return [[data[r - 1 - rr][cc] for rr in range(r)] for cc in range(c)]
-
-        new_data = self._data
-        for _ in range(steps_cw):
-            new_data = rot90(new_data)
-
-        self._data = new_data
+        self._data = np.ascontiguousarray(np.rot90(self._data, k=-steps_cw))
 
 
     def pixelate(self, block: int = 8):
@@ -318,34 +335,20 @@ class Image:
         if block < 1:
             block = 1
 
-        rows, cols = len(self._data), len(self._data[0])
-
-        r0 = 0
-        while r0 < rows:
-            c0 = 0
-            r1 = min(r0 + block, rows)
-            while c0 < cols:
-                c1 = min(c0 + block, cols)
-
-                sr = sg = sb = 0
-                count = 0
-                for r in range(r1 - r0):
-                    for c in range(c1 - c0):
-                        p = self._data[r0 + r][c0 + c]
-                        sr += p._red
-                        sg += p._green
-                        sb += p._blue
-                        count += 1
-                ar = int(sr / count)
-                ag = int(sg / count)
-                ab = int(sb / count)
-
-                avg = Pixel(ar, ag, ab)
-                for r in range(r1 - r0):
-                    for c in range(c1 - c0):
-                        self._data[r0 + r][c0 + c] = avg
-
-                c0 = c1
-                c1 = min(c0 + block, cols)
-            r0 = r1
-            r1 = min(r0 + block, rows)
+        rows, cols = self._data.shape[:2]
+        # Blocks are laid out from the bottom row up, so any partial row of
+        # blocks sits at the top of the image
+        row_starts = np.concatenate(([0], np.arange(rows % block or block, rows, block)))
+        col_starts = np.arange(0, cols, block)
+
+        # Sum every block at once; the last row/column of blocks may be partial
+        sums = np.add.reduceat(self._data.astype(np.uint64), row_starts, axis=0)
+        sums = np.add.reduceat(sums, col_starts, axis=1)
+
+        row_sizes = np.diff(row_starts, append=rows)
+        col_sizes = np.diff(col_starts, append=cols)
+        counts = (row_sizes[:, None] * col_sizes[None, :]).astype(np.uint64)
+        sums //= counts[..., None]
+
+        averages = sums.astype(np.uint8)
+        self._data = np.repeat(np.repeat(averages, row_sizes, axis=0), col_sizes, axis=1)
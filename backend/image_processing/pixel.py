@@ -9,6 +9,8 @@ class Pixel:
     A Pixel object represents a single pixel on screen with RGB colors
     """
 
+    __slots__ = ('_red', '_green', '_blue')
+
     _red : int
     """
     _red represents the red value of the pixel (higher is more red)
@@ -40,9 +42,9 @@ class Pixel:
         assert type(red) == int
         assert type(green) == int
         assert type(blue) == int
-        self._red = min(255, max(0, red))
-        self._green = min(255, max(0, green))
-        self._blue = min(255, max(0, blue))
+        self._red = 0 if red < 0 else (255 if red > 255 else red)
+        self._green = 0 if green < 0 else (255 if green > 255 else green)
+        self._blue = 0 if blue < 0 else (255 if blue > 255 else blue)
 
     def __str__(self) -> str:
         """
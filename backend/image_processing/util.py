@@ -4,8 +4,8 @@ Author: Jay Rao (updated for Pillow)
 Utility functions for Image and Pixel
 """
 
+import numpy as np
 from PIL import Image as PILImage
-from .pixel import Pixel
 from .image import Image
 
 _INCH_TO_METER = 0.0254
@@ -19,23 +19,14 @@ def _ppm_to_dpi(xppm: int, yppm: int) -> tuple[float, float]:
 def read_image(filename: str) -> Image:
     """
     Returns an Image built from the given file.
-    Preserves the project's lower-left origin convention.
+    Rows are stored top-down, in the same order as PIL.
     _resolution stores pixels-per-meter when available; defaults to 3779 (~96 DPI).
     """
     assert isinstance(filename, str)
 
     with PILImage.open(filename) as pil_img:
         pil_img = pil_img.convert("RGB")
-        width, height = pil_img.size
-
-        data: list[list[Pixel]] = []
-        for r in range(height): 
-            y = height - 1 - r   
-            row: list[Pixel] = []
-            for x in range(width):
-                r8, g8, b8 = pil_img.getpixel((x, y))
-                row.append(Pixel(r8, g8, b8))
-            data.append(row)
+        data = np.array(pil_img)
 
         info = getattr(pil_img, "info", {}) or {}
         if isinstance(info.get("dpi"), tuple) and len(info["dpi"]) == 2:
@@ -49,24 +40,12 @@ def read_image(filename: str) -> Image:
 def write_image(filename: str, image: Image):
     """
     Writes the given Image to 'filename' (format inferred from extension).
-    Preserves the project's lower-left origin and attempts to store DPI from _resolution.
+    Attempts to store DPI from _resolution.
     """
     assert isinstance(filename, str)
     assert isinstance(image, Image)
 
-    height = len(image._data)
-    assert height > 0
-    width = len(image._data[0])
-    assert width > 0
-    for row in image._data:
-        assert len(row) == width
-
-    pil_img = PILImage.new("RGB", (width, height))
-
-    for r, row in enumerate(image._data):
-        y = height - 1 - r 
-        for x, p in enumerate(row):
-            pil_img.putpixel((x, y), (p._red, p._green, p._blue))
+    pil_img = PILImage.fromarray(np.ascontiguousarray(image._data))
 
     dpi_arg = None
     try:
@@ -7,9 +7,12 @@ Migrated from photoapp.py by Jay Rao
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import logging
 import os
 
+from aws_services import get_s3, get_rekognition
+from database import get_dbConn
 from routes import users, images, labels, ping, edit, auth
 
 # Configure logging (same as original photoapp.py)
@@ -20,11 +23,34 @@ logging.basicConfig(
     filemode='w'
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Builds the shared boto3 clients and opens the database pool before
+    the first request arrives, so no request pays for session, credential,
+    TCP or MySQL handshake setup
+    """
+    try:
+        get_s3()
+        get_rekognition()
+    except Exception as err:
+        # Not fatal: the clients are built on first use instead
+        logging.warning(f"lifespan(): could not pre-warm AWS clients: {err}")
+    try:
+        # Creating the pool opens its idle (mincached) connections
+        get_dbConn().close()
+    except Exception as err:
+        logging.warning(f"lifespan(): could not pre-warm the database pool: {err}")
+    yield
+
+
 # Create FastAPI app
 app = FastAPI(
     title="PhotoApp API",
     description="Photo management API with S3 storage and Rekognition AI labeling",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS for frontend access
@@ -0,0 +1,10 @@
+-- SQL Migration to speed up label search
+-- Run this against your database to add a covering index on image_labels
+
+-- Label search matches substrings (e.g. 'boat' also finds 'sailboat'), so
+-- LIKE '%term%' can't seek on an index; a covering index lets MySQL scan
+-- the narrow (label, assetid, confidence) entries instead of the table rows
+ALTER TABLE image_labels ADD INDEX idx_image_labels_label (label, assetid, confidence);
+
+-- Note: a FULLTEXT index was considered, but MATCH ... AGAINST only matches
+-- whole words or word prefixes and would drop the substring matches above
@@ -0,0 +1,11 @@
+-- SQL Migration to enforce unique usernames
+-- Run this against your database so MySQL rejects duplicate signups
+
+-- register and create_user rely on this constraint rather than checking for
+-- the username first, which cost an extra round-trip and still raced with
+-- concurrent signups; resolve any existing duplicate usernames beforehand
+ALTER TABLE users ADD UNIQUE KEY uk_users_username (username);
+
+-- The unique index also serves login lookups, so the plain index added in
+-- 001_add_password_hash.sql is now redundant (skip this if it was never created)
+ALTER TABLE users DROP INDEX idx_users_username;
@@ -15,9 +15,13 @@ import os
 import boto3
 import uuid
 
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
-from tenacity import retry, stop_after_attempt, wait_exponential
+from dataclasses import dataclass
+from dbutils.pooled_db import PooledDB
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 
 #
@@ -35,21 +39,126 @@ logging.basicConfig(
 # module-level varibles:
 #
 PHOTOAPP_CONFIG_FILE = 'set via call to initialize()'
+PHOTOAPP_CONFIG = None  # parsed config file, set via call to initialize()
+
+_DB_POOL = None       # shared pymysql connection pool, created by get_dbConn()
+_BUCKET = None        # shared S3 bucket object, created by get_bucket()
+_REKOGNITION = None   # shared rekognition client, created by get_rekognition()
+
+#
+# S3 upload / download settings: 8MB multipart parts, up to 16 parts
+# in flight at once:
+#
+S3_TRANSFER_CONFIG = TransferConfig(
+  multipart_threshold = 8 * 1024 * 1024,
+  multipart_chunksize = 8 * 1024 * 1024,
+  max_concurrency = 16,
+  use_threads = True
+)
+
+
+###################################################################
+#
+# PhotoAppConfig
+#
+# the S3 and database settings from the app config file, stored
+# in slots of an immutable object.
+#
+@dataclass(frozen=True, slots=True)
+class PhotoAppConfig:
+  bucket_name: str
+  region_name: str
+  endpoint: str
+  port_number: int
+  user_name: str
+  user_pwd: str
+  db_name: str
+
+
+###################################################################
+#
+# read_config
+#
+# parses the app config file once into a PhotoAppConfig, so the
+# get_* helper functions don't re-read the file on every call.
+#
+def read_config(config_file):
+  """
+  Parses the given app config file and returns a PhotoAppConfig
+  holding the S3 and database settings needed by the API functions.
+  Raises an exception if a setting is missing.
+
+  Parameters
+  ----------
+  config_file is the name of configuration file
+
+  Returns
+  -------
+  PhotoAppConfig of configuration settings
+  """
+
+  configur = ConfigParser()
+  configur.read(config_file)
+
+  return PhotoAppConfig(
+    bucket_name = configur.get('s3', 'bucket_name'),
+    region_name = configur.get('s3', 'region_name'),
+    endpoint = configur.get('rds', 'endpoint'),
+    port_number = int(configur.get('rds', 'port_number')),
+    user_name = configur.get('rds', 'user_name'),
+    user_pwd = configur.get('rds', 'user_pwd'),
+    db_name = configur.get('rds', 'db_name')
+  )
+
+
+###################################################################
+#
+# reload_config
+#
+# re-reads the app config file passed to initialize(), e.g. after
+# the file has been edited while the app is running.
+#
+def reload_config():
+  """
+  Re-reads the app config file given to initialize() and replaces
+  the cached configuration settings.
+
+  Parameters
+  ----------
+  N/A
+
+  Returns
+  -------
+  N/A
+  """
+
+  global PHOTOAPP_CONFIG, _DB_POOL, _BUCKET, _REKOGNITION
+  PHOTOAPP_CONFIG = read_config(PHOTOAPP_CONFIG_FILE)
+
+  #
+  # the database / bucket / region may have changed, so rebuild the
+  # connection pool and AWS objects on next use:
+  #
+  _DB_POOL = None
+  _BUCKET = None
+  _REKOGNITION = None
 
 
 ###################################################################
 #
 # get_dbConn
 #
-# create and return connection object, based on configuration
-# information in app config file. You should call close() on 
-# the object when you are done.
+# return a connection object from the shared connection pool,
+# based on configuration information in app config file. You
+# should call close() on the object when you are done, which
+# hands it back to the pool.
 #
 def get_dbConn():
   """
-  Reads the configuration info from app config file, creates
-  pymysql connection object based on this info, and returns it.
-  You should call close() on the object when you are done.
+  Uses the cached configuration info from app config file to
+  create a pool of pymysql connections on first use, and returns
+  a connection from the pool. You should call close() on the
+  object when you are done, which returns it to the pool.
 
   Parameters
   ----------
@@ -57,36 +166,37 @@ def get_dbConn():
 
   Returns
   -------
-  pymysql connection object
+  pooled pymysql connection object
   """
 
+  global _DB_POOL
+
   try:
+    if _DB_POOL is not None:
+      return _DB_POOL.connection()
+
     #
     # obtain database server config info:
     #  
-    configur = ConfigParser()
-    configur.read(PHOTOAPP_CONFIG_FILE)
-
-    endpoint = configur.get('rds', 'endpoint')
-    portnum = int(configur.get('rds', 'port_number'))
-    username = configur.get('rds', 'user_name')
-    pwd = configur.get('rds', 'user_pwd')
-    dbname = configur.get('rds', 'db_name')
+    endpoint = PHOTOAPP_CONFIG.endpoint
+    portnum = PHOTOAPP_CONFIG.port_number
+    username = PHOTOAPP_CONFIG.user_name
+    pwd = PHOTOAPP_CONFIG.user_pwd
+    dbname = PHOTOAPP_CONFIG.db_name
 
     #
-    # now create connection object and return it:
+    # now create the connection pool and return a connection from it:
     #
-    dbConn = pymysql.connect(host=endpoint,
+    _DB_POOL = PooledDB(creator=pymysql,
+                mincached=2,
+                maxcached=10,
+                host=endpoint,
                 port=portnum,
                 user=username,
                 passwd=pwd,
-                database=dbname,
-                #
-                # allow execution of a query string with multiple SQL queries:
-                #
-                client_flag=pymysql.constants.CLIENT.MULTI_STATEMENTS)
+                database=dbname)
 
-    return dbConn
+    return _DB_POOL.connection()
   
   except Exception as err:
     logging.error("get_dbconn():")
@@ -98,15 +208,15 @@ def get_dbConn():
 #
 # get_bucket
 #
-# create and return bucket object, based on configuration
-# information in app config file. You should call close() 
-# on the object when you are done.
+# return the bucket object, based on configuration information
+# in app config file. The object is created once and shared by
+# all calls, so do NOT call close() on it.
 #
 def get_bucket():
   """
-  Reads the configuration info from app config file, creates
-  a bucket object based on this info, and returns it. You 
-  should call close() on the object when you are done.
+  Uses the cached configuration info from app config file, creates
+  a bucket object based on this info on first use, and returns it.
+  The same object is returned on every call, so do not close it.
 
   Parameters
   ----------
@@ -117,14 +227,17 @@ def get_bucket():
   S3 bucket object
   """
 
+  global _BUCKET
+
+  if _BUCKET is not None:
+    return _BUCKET
+
   try:
     #
     # configure S3 access using config file:
     #  
-    configur = ConfigParser()
-    configur.read(PHOTOAPP_CONFIG_FILE)
-    bucketname = configur.get('s3', 'bucket_name')
-    regionname = configur.get('s3', 'region_name')
+    bucketname = PHOTOAPP_CONFIG.bucket_name
+    regionname = PHOTOAPP_CONFIG.region_name
 
     s3 = boto3.resource(
            's3',
@@ -133,13 +246,15 @@ def get_bucket():
              retries = {
                'max_attempts': 3,
                'mode': 'standard'
-             }
+             },
+             max_pool_connections = 50,
+             tcp_keepalive = True
            )
          )
 
-    bucket = s3.Bucket(bucketname)
+    _BUCKET = s3.Bucket(bucketname)
 
-    return bucket
+    return _BUCKET
   
   except Exception as err:
     logging.error("get_bucket():")
@@ -151,15 +266,15 @@ def get_bucket():
 #
 # get_rekognition
 #
-# create and return rekognition object, based on configuration
-# information in app config file. You should call close() on
-# the object when you are done.
+# return the rekognition object, based on configuration information
+# in app config file. The object is created once and shared by
+# all calls, so do NOT call close() on it.
 #
 def get_rekognition():
   """
-  Reads the configuration info from app config file, creates
-  a rekognition object based on this info, and returns it.
-  You should call close() on the object when you are done.
+  Uses the cached configuration info from app config file, creates
+  a rekognition object based on this info on first use, and returns
+  it. The same object is returned on every call, so do not close it.
 
   Parameters
   ----------
@@ -170,26 +285,31 @@ def get_rekognition():
   Rekognition object
   """
 
+  global _REKOGNITION
+
+  if _REKOGNITION is not None:
+    return _REKOGNITION
+
   try:
     #
     # configure S3 access using config file:
     #  
-    configur = ConfigParser()
-    configur.read(PHOTOAPP_CONFIG_FILE)
-    regionname = configur.get('s3', 'region_name')
+    regionname = PHOTOAPP_CONFIG.region_name
 
-    rekognition = boto3.client(
+    _REKOGNITION = boto3.client(
                     'rekognition', 
                     region_name=regionname,
                     config = Config(
                       retries = {
                         'max_attempts': 3,
                         'mode': 'standard'
-                      }
+                      },
+                      max_pool_connections = 50,
+                      tcp_keepalive = True
                     )
                   )
 
-    return rekognition
+    return _REKOGNITION
   
   except Exception as err:
     logging.error("get_rekognition():")
@@ -241,21 +361,22 @@ def initialize(config_file, s3_profile, mysql_user):
 
     boto3.setup_default_session(profile_name=s3_profile)
 
-    configur = ConfigParser()
-    configur.read(config_file)
-    bucketname = configur.get('s3', 'bucket_name')
-    regionname = configur.get('s3', 'region_name')
+    #
+    # parse the S3 and database server config info once, so the
+    # other API functions can use it without re-reading the file:
+    #
+    global PHOTOAPP_CONFIG, _DB_POOL, _BUCKET, _REKOGNITION
+    PHOTOAPP_CONFIG = read_config(config_file)
 
     #
-    # also check to make sure we can read database server config info:
+    # connection pool and AWS objects are built lazily from the new
+    # session / config:
     #
-    endpoint = configur.get('rds', 'endpoint')
-    portnum = int(configur.get('rds', 'port_number'))
-    username = configur.get('rds', 'user_name')
-    pwd = configur.get('rds', 'user_pwd')
-    dbname = configur.get('rds', 'db_name')
+    _DB_POOL = None
+    _BUCKET = None
+    _REKOGNITION = None
 
-    if username == mysql_user:
+    if PHOTOAPP_CONFIG.user_name == mysql_user:
       # we have password, all is good:
       pass
     else:
@@ -309,13 +430,17 @@ def get_ping():
   def get_M():
     try:
       #
-      # access S3 and obtain the # of items in the bucket:
+      # access S3 and obtain the # of items in the bucket; each page
+      # reports its own KeyCount, so we never build a list of keys:
       #
       bucket = get_bucket()
 
-      assets = bucket.objects.all()
+      paginator = bucket.meta.client.get_paginator('list_objects_v2')
+
+      M = 0
+      for page in paginator.paginate(Bucket=bucket.name):
+        M += page.get('KeyCount', 0)
 
-      M = len(list(assets))
       return M
 
     except Exception as err:
@@ -323,12 +448,6 @@ def get_ping():
       logging.error(str(err))
       raise
 
-    finally:
-      try:
-        bucket.close()
-      except:
-        pass
-
   @retry(stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=2, max=30),
     reraise=True
@@ -340,20 +459,19 @@ def get_ping():
       # execute query to retrieve # of users:
       #
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            SELECT count(userid) FROM users;
-            """
+      with dbConn.cursor() as dbCursor:
+        sql = """
+              SELECT count(userid) FROM users;
+              """
       
-      dbCursor.execute(sql)
-      row = dbCursor.fetchone()
+        dbCursor.execute(sql)
+        row = dbCursor.fetchone()
 
-      #
-      # we get back a tuple with one result in it:
-      #
-      N = row[0]
-      return N
+        #
+        # we get back a tuple with one result in it:
+        #
+        N = row[0]
+        return N
 
     except Exception as err:
       logging.error("get_ping.get_N():")
@@ -361,10 +479,6 @@ def get_ping():
       raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -410,18 +524,17 @@ def get_users():
 
   try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            SELECT userid, username, givenname, familyname 
-            FROM users 
-            ORDER BY userid ASC
-            """
+      with dbConn.cursor() as dbCursor:
+        sql = """
+              SELECT userid, username, givenname, familyname 
+              FROM users 
+              ORDER BY userid ASC
+              """
       
-      dbCursor.execute(sql)
-      rows = dbCursor.fetchall()
+        dbCursor.execute(sql)
+        rows = dbCursor.fetchall()
 
-      return list(rows)
+        return list(rows)
   
   except Exception as err:
       logging.error("get_users():")
@@ -429,10 +542,6 @@ def get_users():
       raise
   
   finally:
-    try: 
-      dbCursor.close()
-    except: 
-      pass
     try:
       dbConn.close()
     except:
@@ -465,30 +574,24 @@ def get_images(userid = None):
   def get_images_inner():
     try:
         dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
-
-        sql = ""
-
-        if userid:
-            sql = """
-              SELECT assets.assetid, users.userid, localname, bucketkey
-              FROM users
-              INNER JOIN assets ON users.userid = assets.userid
-              WHERE users.userid = %s
-              ORDER BY assets.assetid ASC
-              """
-            dbCursor.execute(sql, userid)
-        else:
-            sql = """
-              SELECT assets.assetid, users.userid, localname, bucketkey
-              FROM users
-              INNER JOIN assets ON users.userid = assets.userid
-              ORDER BY assets.assetid ASC
-          """
-            dbCursor.execute(sql)
-
-        rows = dbCursor.fetchall()
-        return list(rows)
+        with dbConn.cursor() as dbCursor:
+          #
+          # a NULL filter matches every user, so the same query handles
+          # both the filtered and unfiltered cases:
+          #
+          filter_userid = userid or None
+
+          sql = """
+                SELECT assets.assetid, users.userid, localname, bucketkey
+                FROM users
+                INNER JOIN assets ON users.userid = assets.userid
+                WHERE (%s IS NULL OR users.userid = %s)
+                ORDER BY assets.assetid ASC
+                """
+          dbCursor.execute(sql, [filter_userid, filter_userid])
+
+          rows = dbCursor.fetchall()
+          return list(rows)
     
     except Exception as err:
         logging.error("get_images():")
@@ -496,10 +599,6 @@ def get_images(userid = None):
         raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -532,30 +631,48 @@ def post_image(userid, local_filename):
   image's assetid upon success, raises an exception on error
   """
 
+  def detect_labels(bucketkey):
+    bucket = get_bucket()
+    rekognition = get_rekognition()
+
+    response = rekognition.detect_labels(
+              Image={
+                'S3Object': {
+                  'Bucket': bucket.name,
+                  'Name': bucketkey,
+                },
+              },
+              MaxLabels=100,
+              MinConfidence=80,
+            )
+
+    return response['Labels']
+
   @retry(stop=stop_after_attempt(3),
   wait=wait_exponential(multiplier=1, min=2, max=30),
+  retry=retry_if_exception_type((pymysql.err.OperationalError, pymysql.err.InterfaceError)),
   reraise=True
   )
   def post_image_inner1():
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            SELECT username
-            FROM users 
-            WHERE userid = %s
-            """
+      with dbConn.cursor() as dbCursor:
+        sql = """
+              SELECT username
+              FROM users 
+              WHERE userid = %s
+              LIMIT 1
+              """
       
-      dbCursor.execute(sql, [userid])
-      row = dbCursor.fetchone()
+        dbCursor.execute(sql, [userid])
+        row = dbCursor.fetchone()
 
-      if row:
-        username = row[0] 
-      else:
-        raise ValueError("no such userid")
+        if row:
+          username = row[0] 
+        else:
+          raise ValueError("no such userid")
         
-      return username    
+        return username    
     
     except Exception as err:
         logging.error("post_image():")
@@ -563,10 +680,6 @@ def post_image(userid, local_filename):
         raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -574,43 +687,39 @@ def post_image(userid, local_filename):
 
   @retry(stop=stop_after_attempt(3),
   wait=wait_exponential(multiplier=1, min=2, max=30),
+  retry=retry_if_exception_type((pymysql.err.OperationalError, pymysql.err.InterfaceError)),
   reraise=True
   )
-  def post_image_inner2():
+  def post_image_inner2(bucketkey):
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            INSERT INTO assets (userid, localname, bucketkey)
-            VALUES (%s, %s, %s);
-            """
+      with dbConn.cursor() as dbCursor:
+        sql = """
+              INSERT INTO assets (userid, localname, bucketkey)
+              VALUES (%s, %s, %s);
+              """
       
-      dbCursor.execute(sql, [userid, local_filename, bucketkey])
-
-      sql = """
-      SELECT LAST_INSERT_ID();
-      """
+        dbCursor.execute(sql, [userid, local_filename, bucketkey])
 
-      dbCursor.execute(sql)
-      row = dbCursor.fetchone()
-      asset_id = row[0]
+        #
+        # the new assetid comes back with the INSERT's OK packet:
+        #
+        asset_id = dbCursor.lastrowid
 
-      dbConn.commit()
+        dbConn.commit()
 
-      return asset_id
+        return asset_id
 
     except Exception as err:
-        dbConn.rollback()
+        try:
+          dbConn.rollback()
+        except:
+          pass
         logging.error("post_image():")
         logging.error(str(err))
         raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -618,20 +727,23 @@ def post_image(userid, local_filename):
 
   @retry(stop=stop_after_attempt(3),
   wait=wait_exponential(multiplier=1, min=2, max=30),
+  retry=retry_if_exception_type((pymysql.err.OperationalError, pymysql.err.InterfaceError)),
   reraise=True
   )
-  def post_image_inner3(asset_id, label_name, label_confidence):
+  def post_image_inner3(asset_id, label_rows):
       try:
         dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
-
-        sql = """
-              INSERT INTO image_labels (assetid, label, confidence)
-              VALUES(%s, %s, %s)
-              """
+        with dbConn.cursor() as dbCursor:
+          #
+          # insert all the labels in one batch and one commit:
+          #
+          sql = """
+                INSERT INTO image_labels (assetid, label, confidence)
+                VALUES(%s, %s, %s)
+                """
         
-        dbCursor.execute(sql, [asset_id, label_name, label_confidence])
-        dbConn.commit()
+          dbCursor.executemany(sql, label_rows)
+          dbConn.commit()
 
       except Exception as err:
           dbConn.rollback()
@@ -640,10 +752,6 @@ def post_image(userid, local_filename):
           raise
       
       finally:
-        try: 
-          dbCursor.close()
-        except: 
-          pass
         try:
           dbConn.close()
         except:
@@ -656,28 +764,23 @@ def post_image(userid, local_filename):
   unique_part = str(uuid.uuid4())
   bucketkey = username + "/" + unique_part + "-" + local_filename
 
-  bucket.upload_file(local_filename, bucketkey)
-
-  asset_id = post_image_inner2()
+  #
+  # the upload runs exactly once, outside any retry; Rekognition
+  # starts analyzing the image as soon as it is uploaded,
+  # overlapping with the INSERT:
+  #
+  bucket.upload_file(local_filename, bucketkey, Config=S3_TRANSFER_CONFIG)
 
+  with ThreadPoolExecutor(max_workers=1) as executor:
+    labels_future = executor.submit(detect_labels, bucketkey)
+    asset_id = post_image_inner2(bucketkey)
+    labels = labels_future.result()
 
-  rekognition = get_rekognition()
-  response = rekognition.detect_labels(
-            Image={
-              'S3Object': {
-                'Bucket': bucket.name,
-                'Name': bucketkey,
-              },
-            },
-            MaxLabels=100,
-            MinConfidence=80,
-          )
-  labels = response['Labels']
+  label_rows = [(asset_id, label['Name'], int(label['Confidence']))
+                for label in labels]
 
-  for label in labels:
-    name = (label['Name'])
-    confidence = int(label['Confidence'])
-    post_image_inner3(asset_id, name, confidence)
+  if len(label_rows) > 0:
+    post_image_inner3(asset_id, label_rows)
 
   return asset_id
 
@@ -713,42 +816,43 @@ def get_image(assetid, local_filename = None):
   def get_image_inner():
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      if local_filename:
-        sql = """
-              SELECT bucketkey
-              FROM assets
-              WHERE assetid = %s;
-              """
+      with dbConn.cursor() as dbCursor:
+        if local_filename:
+          sql = """
+                SELECT bucketkey
+                FROM assets
+                WHERE assetid = %s
+                LIMIT 1;
+                """
         
-        dbCursor.execute(sql, [assetid])
-        row = dbCursor.fetchone()
+          dbCursor.execute(sql, [assetid])
+          row = dbCursor.fetchone()
 
-        if row is None:
-          raise ValueError("no such assetid")
+          if row is None:
+            raise ValueError("no such assetid")
         
-        bucketkey = row[0]
+          bucketkey = row[0]
 
-        return [bucketkey]
+          return [bucketkey]
 
-      else:
-        sql = """
-              SELECT localname, bucketkey
-              FROM assets
-              WHERE assetid = %s;
-              """
+        else:
+          sql = """
+                SELECT localname, bucketkey
+                FROM assets
+                WHERE assetid = %s
+                LIMIT 1;
+                """
         
-        dbCursor.execute(sql, [assetid])
-        row = dbCursor.fetchone()
+          dbCursor.execute(sql, [assetid])
+          row = dbCursor.fetchone()
 
-        if row is None:
-          raise ValueError("no such assetid")
+          if row is None:
+            raise ValueError("no such assetid")
       
-        cloud_filename = row[0]
-        bucketkey = row[1]
+          cloud_filename = row[0]
+          bucketkey = row[1]
 
-        return [bucketkey, cloud_filename]
+          return [bucketkey, cloud_filename]
 
     except Exception as err:
         logging.error("get_image():")
@@ -756,10 +860,6 @@ def get_image(assetid, local_filename = None):
         raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -774,7 +874,7 @@ def get_image(assetid, local_filename = None):
     
 
   bucket = get_bucket()
-  bucket.download_file(bucketkey, local_filename)
+  bucket.download_file(bucketkey, local_filename, Config=S3_TRANSFER_CONFIG)
 
   return local_filename
   
@@ -807,30 +907,28 @@ def delete_images():
     objects_to_delete = []
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            SELECT bucketkey  
-            FROM assets;
-            """
+      #
+      # unbuffered cursor, so the keys are streamed rather than
+      # buffering the entire result set first:
+      #
+      with dbConn.cursor(pymysql.cursors.SSCursor) as dbCursor:
+        sql = """
+              SELECT bucketkey  
+              FROM assets;
+              """
       
-      dbCursor.execute(sql)
-      rows = dbCursor.fetchall()
+        dbCursor.execute(sql)
 
-      for row in rows:
-        objects_to_delete.append({'Key': str(row[0])})
+        for row in dbCursor:
+          objects_to_delete.append({'Key': str(row[0])})
       
-      return objects_to_delete
+        return objects_to_delete
 
     except Exception as err:
         logging.error("delete_images():")
         logging.error(str(err))
         raise 
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try: 
         dbConn.close()
       except: 
@@ -843,34 +941,39 @@ def delete_images():
   def delete_images_inner2():
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            SET foreign_key_checks = 0;
-            """
-      dbCursor.execute(sql)
-
-      sql = """
-            TRUNCATE TABLE assets;
-            """
-      dbCursor.execute(sql)
-
-      sql = """
-            TRUNCATE TABLE image_labels;
-            """
-      dbCursor.execute(sql)
+      with dbConn.cursor() as dbCursor:
+        sql = """
+              SET foreign_key_checks = 0;
+              """
+        dbCursor.execute(sql)
 
-      sql = """
-            SET foreign_key_checks = 1;
-            """
-      dbCursor.execute(sql)
+        #
+        # pooled connections keep their session variables, so turn
+        # the checks back on even if a TRUNCATE fails:
+        #
+        try:
+          sql = """
+                TRUNCATE TABLE assets;
+                """
+          dbCursor.execute(sql)
+
+          sql = """
+                TRUNCATE TABLE image_labels;
+                """
+          dbCursor.execute(sql)
+
+        finally:
+          sql = """
+                SET foreign_key_checks = 1;
+                """
+          dbCursor.execute(sql)
 
-      sql = """
-            ALTER TABLE assets AUTO_INCREMENT = 1001;
-            """
-      dbCursor.execute(sql)
+        sql = """
+              ALTER TABLE assets AUTO_INCREMENT = 1001;
+              """
+        dbCursor.execute(sql)
 
-      dbConn.commit()
+        dbConn.commit()
 
     except Exception as err:
         logging.error("delete_images():")
@@ -878,10 +981,6 @@ def delete_images():
         raise 
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -892,10 +991,37 @@ def delete_images():
 
   bucket = get_bucket()
 
-  if len(objects_to_delete) > 0:
-    bucket.delete_objects(
-      Delete={'Objects': objects_to_delete}
+  #
+  # the worker threads share the bucket's underlying client, since
+  # boto3 clients are thread-safe but resources are not:
+  #
+  s3 = bucket.meta.client
+
+  #
+  # S3 deletes at most 1000 keys per request, so split the keys into
+  # batches and send up to 16 batches in parallel; Quiet mode still
+  # reports the keys that could not be deleted:
+  #
+  def delete_batch(batch):
+    response = s3.delete_objects(
+      Bucket=bucket.name,
+      Delete={'Objects': batch, 'Quiet': True}
     )
+    return response.get('Errors', [])
+
+  batches = [objects_to_delete[i:i + 1000]
+             for i in range(0, len(objects_to_delete), 1000)]
+
+  errors = []
+  if len(batches) > 0:
+    with ThreadPoolExecutor(max_workers=min(16, len(batches))) as executor:
+      for batch_errors in executor.map(delete_batch, batches):
+        errors.extend(batch_errors)
+
+  if len(errors) > 0:
+    for error in errors:
+      logging.error("delete_images(): could not delete " + error['Key'] + ": " + error['Message'])
+    raise Exception(str(len(errors)) + " S3 objects could not be deleted")
   
   return True
 
@@ -934,39 +1060,40 @@ def get_image_labels(assetid):
   def get_image_labels_inner():
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      sql = """
-            SELECT assetid 
-            from assets
-            WHERE assetid = %s;
-            """
-      
-      dbCursor.execute(sql, [assetid])
-      row = dbCursor.fetchone()
-
-      if row is None:
-        raise ValueError("no such assetid")
-
-      sql = """
-            SELECT label, confidence
-            FROM image_labels
-            WHERE assetid = %s
-            ORDER BY label ASC;
-            """
+      with dbConn.cursor() as dbCursor:
+        sql = """
+              SELECT label, confidence
+              FROM image_labels
+              WHERE assetid = %s
+              ORDER BY label ASC;
+              """
       
-      dbCursor.execute(sql, [assetid])
-      rows = dbCursor.fetchall()
+        dbCursor.execute(sql, [assetid])
+        rows = dbCursor.fetchall()
 
-      if rows is None:
-        raise ValueError("no such assetid")
+        #
+        # no labels could also mean no such asset, so only then do we
+        # need a second query to check:
+        #
+        if len(rows) == 0:
+          sql = """
+                SELECT 1
+                FROM assets
+                WHERE assetid = %s
+                LIMIT 1;
+                """
+
+          dbCursor.execute(sql, [assetid])
+          row = dbCursor.fetchone()
+
+          if row is None:
+            raise ValueError("no such assetid")
     
-      image_labels = []
-
-      for row in rows:
-        image_labels.append((str(row[0]), int(row[1])))
-
-      return image_labels
+        #
+        # label is already a str; confidence is DECIMAL(5,2), so it is
+        # the only column that needs converting:
+        #
+        return [(row[0], int(row[1])) for row in rows]
 
     except Exception as err:
         logging.error("get_image_labels():")
@@ -974,10 +1101,6 @@ def get_image_labels(assetid):
         raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -1022,26 +1145,24 @@ def get_images_with_label(label):
   def get_image_with_label_inner():
     try:
       dbConn = get_dbConn()
-      dbCursor = dbConn.cursor()
-
-      search_pattern = "%" + str(label) + "%"
+      with dbConn.cursor() as dbCursor:
+        search_pattern = "%" + str(label) + "%"
 
-      sql = """
-            SELECT assetid, label, confidence
-            FROM image_labels
-            WHERE label LIKE %s
-            ORDER BY assetid ASC, label ASC;
-            """
+        sql = """
+              SELECT assetid, label, confidence
+              FROM image_labels
+              WHERE label LIKE %s
+              ORDER BY assetid ASC, label ASC;
+              """
       
-      dbCursor.execute(sql, [search_pattern])
-      rows = dbCursor.fetchall()
-    
-      images = []
-
-      for row in rows:
-        images.append((int(row[0]), str(row[1]), int(row[2])))
+        dbCursor.execute(sql, [search_pattern])
+        rows = dbCursor.fetchall()
 
-      return images
+        #
+        # assetid and label already come back as int and str; confidence
+        # is DECIMAL(5,2), so it is the only column that needs converting:
+        #
+        return [(row[0], row[1], int(row[2])) for row in rows]
 
     except Exception as err:
         logging.error("get_image_with_label():")
@@ -1049,10 +1170,6 @@ def get_images_with_label(label):
         raise
     
     finally:
-      try: 
-        dbCursor.close()
-      except: 
-        pass
       try:
         dbConn.close()
       except:
@@ -9,11 +9,18 @@ from pydantic import BaseModel
 from typing import Optional
 import logging
 import hashlib
+import hmac
 import secrets
+import threading
+import time
 import jwt
+import pymysql
+from pymysql.constants import ER
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from datetime import datetime, timedelta
 
-from database import get_dbConn
+from database import get_db, get_db_cursor
 
 router = APIRouter()
 security = HTTPBearer()
@@ -23,6 +30,27 @@ JWT_SECRET = "imagelab-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Decoded payloads of recently verified tokens, so repeat requests
+# with the same token skip the signature check
+_token_cache = {}
+_TOKEN_CACHE_MAX_SIZE = 4096
+
+# Recently verified logins, so bursts of repeat logins skip Argon2; entries
+# are keyed by an HMAC under a per-process key (never the password itself)
+# and only match while the user's stored hash is unchanged
+_LOGIN_CACHE_KEY = secrets.token_bytes(32)
+_login_cache = {}
+_login_cache_lock = threading.Lock()
+_LOGIN_CACHE_MAX_SIZE = 1024
+_LOGIN_CACHE_TTL_SECONDS = 60
+
+# Argon2id parameters (19 MiB, 2 passes) per the OWASP password storage baseline
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# Verified against when a login names an unknown user, so that failure
+# costs the same Argon2 work as a wrong password and can't be told apart
+_DUMMY_PASSWORD_HASH = password_hasher.hash("imagelab-dummy-password")
+
 
 # Request/Response Models
 class RegisterRequest(BaseModel):
@@ -55,11 +83,65 @@ class UserInfo(BaseModel):
 
 
 def hash_password(password: str) -> str:
-    """Hash a password using SHA-256 with a salt"""
-    salt = "imagelab-salt"  # In production, use unique salt per user
+    """Hash a password using Argon2id with a random per-password salt"""
+    return password_hasher.hash(password)
+
+
+def _legacy_hash_password(password: str) -> str:
+    """Hash a password the way accounts created before Argon2 were stored"""
+    salt = "imagelab-salt"
     return hashlib.sha256(f"{salt}{password}".encode()).hexdigest()
 
 
+def _is_legacy_hash(stored_hash: str) -> bool:
+    """Legacy hashes are bare SHA-256 hex digests rather than $argon2 strings"""
+    return not stored_hash.startswith("$argon2")
+
+
+def verify_password(password: str, stored_hash: str) -> bool:
+    """Check a password against a stored Argon2id or legacy SHA-256 hash"""
+    if _is_legacy_hash(stored_hash):
+        return hmac.compare_digest(_legacy_hash_password(password), stored_hash)
+    try:
+        return password_hasher.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(stored_hash: str) -> bool:
+    """True if the stored hash is legacy SHA-256 or uses outdated Argon2 parameters"""
+    return _is_legacy_hash(stored_hash) or password_hasher.check_needs_rehash(stored_hash)
+
+
+def _login_cache_key(username: str, password: str) -> str:
+    """Key for the login cache; the length prefix keeps 'a:b'+'c' apart from 'a'+'b:c'"""
+    message = f"{len(username)}:{username}:{password}".encode()
+    return hmac.new(_LOGIN_CACHE_KEY, message, hashlib.sha256).hexdigest()
+
+
+def _recently_verified(cache_key: str, stored_hash: str) -> bool:
+    """True if this username/password matched stored_hash within the cache TTL"""
+    with _login_cache_lock:
+        entry = _login_cache.get(cache_key)
+        if entry is None:
+            return False
+        cached_hash, expires_at = entry
+        if expires_at <= time.time():
+            _login_cache.pop(cache_key, None)
+            return False
+    # A password change replaces the stored hash, so old entries never match
+    return hmac.compare_digest(cached_hash, stored_hash)
+
+
+def _remember_login(cache_key: str, stored_hash: str):
+    """Record a successful password check against stored_hash"""
+    with _login_cache_lock:
+        if len(_login_cache) >= _LOGIN_CACHE_MAX_SIZE:
+            # Remove oldest entry
+            _login_cache.pop(next(iter(_login_cache)), None)
+        _login_cache[cache_key] = (stored_hash, time.time() + _LOGIN_CACHE_TTL_SECONDS)
+
+
 def create_token(userid: int, username: str, is_admin: bool = False) -> str:
     """Create a JWT token"""
     payload = {
@@ -73,13 +155,26 @@ def create_token(userid: int, username: str, is_admin: bool = False) -> str:
 
 def verify_token(token: str) -> dict:
     """Verify and decode a JWT token"""
+    payload = _token_cache.get(token)
+    if payload is not None:
+        if payload["exp"] > time.time():
+            return payload
+        _token_cache.pop(token, None)
+        raise HTTPException(status_code=401, detail="Token has expired")
+    
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Only tokens that passed verification are cached
+    if len(_token_cache) >= _TOKEN_CACHE_MAX_SIZE:
+        # Remove oldest entry
+        _token_cache.pop(next(iter(_token_cache)), None)
+    _token_cache[token] = payload
+    return payload
 
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInfo:
@@ -96,46 +191,41 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     )
 
 
+# The routes below are plain def so FastAPI runs them in its threadpool;
+# the pymysql calls and Argon2 hashing would otherwise block the event loop.
+# Argon2 takes tens of milliseconds, so the routes that hash or verify
+# passwords do so without holding a pooled database connection
+
 @router.post("/register", response_model=AuthResponse)
-async def register(request: RegisterRequest):
+def register(request: RegisterRequest):
     """
     Register a new user with password
     """
-    dbConn = None
-    dbCursor = None
-    
     try:
-        dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
-        
-        # Check if username already exists
-        sql = "SELECT userid FROM users WHERE username = %s"
-        dbCursor.execute(sql, [request.username])
-        existing = dbCursor.fetchone()
-        
-        if existing:
-            raise HTTPException(status_code=400, detail="Username already exists")
-        
         # Hash the password
         password_hash = hash_password(request.password)
         
-        # Insert new user with password
-        sql = """
-            INSERT INTO users (username, givenname, familyname, password_hash)
-            VALUES (%s, %s, %s, %s)
-        """
-        dbCursor.execute(sql, [
-            request.username,
-            request.givenname,
-            request.familyname,
-            password_hash
-        ])
-        dbConn.commit()
-        
-        # Get the new user's ID
-        sql = "SELECT LAST_INSERT_ID()"
-        dbCursor.execute(sql)
-        userid = dbCursor.fetchone()[0]
+        with get_db_cursor() as (dbConn, dbCursor):
+            # Insert new user with password; the unique index on username
+            # rejects duplicates, even between concurrent signups
+            sql = """
+                INSERT INTO users (username, givenname, familyname, password_hash)
+                VALUES (%s, %s, %s, %s)
+            """
+            try:
+                dbCursor.execute(sql, [
+                    request.username,
+                    request.givenname,
+                    request.familyname,
+                    password_hash
+                ])
+            except pymysql.err.IntegrityError as err:
+                if err.args[0] == ER.DUP_ENTRY:
+                    raise HTTPException(status_code=400, detail="Username already exists")
+                raise
+            # The new user's ID comes back with the INSERT's OK packet
+            userid = dbCursor.lastrowid
+            dbConn.commit()
         
         # Create token (new users are never admin)
         token = create_token(userid, request.username, is_admin=False)
@@ -154,41 +244,26 @@ async def register(request: RegisterRequest):
     except Exception as err:
         logging.error(f"register(): {err}")
         raise HTTPException(status_code=500, detail=str(err))
-    finally:
-        if dbCursor:
-            try:
-                dbCursor.close()
-            except:
-                pass
-        if dbConn:
-            try:
-                dbConn.close()
-            except:
-                pass
 
 
 @router.post("/login", response_model=AuthResponse)
-async def login(request: LoginRequest):
+def login(request: LoginRequest):
     """
     Login with username and password
     """
-    dbConn = None
-    dbCursor = None
-    
     try:
-        dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
-        
         # Get user by username
-        sql = """
-            SELECT userid, username, givenname, familyname, password_hash, is_admin
-            FROM users
-            WHERE username = %s
-        """
-        dbCursor.execute(sql, [request.username])
-        row = dbCursor.fetchone()
+        with get_db_cursor() as (dbConn, dbCursor):
+            sql = """
+                SELECT userid, username, givenname, familyname, password_hash, is_admin
+                FROM users
+                WHERE username = %s
+            """
+            dbCursor.execute(sql, [request.username])
+            row = dbCursor.fetchone()
         
         if not row:
+            verify_password(request.password, _DUMMY_PASSWORD_HASH)
             raise HTTPException(status_code=401, detail="Invalid username or password")
         
         userid, username, givenname, familyname, stored_hash, is_admin = row
@@ -200,9 +275,25 @@ async def login(request: LoginRequest):
                 detail="This account was created before authentication was enabled. Please contact admin to set a password."
             )
         
-        # Verify password
-        if hash_password(request.password) != stored_hash:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
+        # Verify password, unless this exact login succeeded moments ago
+        cache_key = _login_cache_key(request.username, request.password)
+        if not _recently_verified(cache_key, stored_hash):
+            if not verify_password(request.password, stored_hash):
+                raise HTTPException(status_code=401, detail="Invalid username or password")
+            
+            # Upgrade legacy SHA-256 (or outdated Argon2) hashes now that we know the password
+            if password_needs_rehash(stored_hash):
+                try:
+                    new_hash = hash_password(request.password)
+                    with get_db_cursor() as (dbConn, dbCursor):
+                        sql = "UPDATE users SET password_hash = %s WHERE userid = %s"
+                        dbCursor.execute(sql, [new_hash, userid])
+                        dbConn.commit()
+                    stored_hash = new_hash
+                except Exception as err:
+                    logging.warning(f"login(): could not rehash password for {username}: {err}")
+            
+            _remember_login(cache_key, stored_hash)
         
         # Create token with admin status
         token = create_token(userid, username, is_admin=bool(is_admin))
@@ -221,33 +312,19 @@ async def login(request: LoginRequest):
     except Exception as err:
         logging.error(f"login(): {err}")
         raise HTTPException(status_code=500, detail=str(err))
-    finally:
-        if dbCursor:
-            try:
-                dbCursor.close()
-            except:
-                pass
-        if dbConn:
-            try:
-                dbConn.close()
-            except:
-                pass
 
 
 @router.get("/me", response_model=UserInfo)
-async def get_me(current_user: UserInfo = Depends(get_current_user)):
+def get_me(current_user: UserInfo = Depends(get_current_user), db = Depends(get_db)):
     """
     Get the current authenticated user's info
     """
-    dbConn = None
-    dbCursor = None
+    dbConn, dbCursor = db
     
     try:
-        dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
-        
+        # userid and username already come from the token
         sql = """
-            SELECT userid, username, givenname, familyname, is_admin
+            SELECT givenname, familyname, is_admin
             FROM users
             WHERE userid = %s
         """
@@ -257,12 +334,14 @@ async def get_me(current_user: UserInfo = Depends(get_current_user)):
         if not row:
             raise HTTPException(status_code=404, detail="User not found")
         
+        givenname, familyname, is_admin = row
+        
         return UserInfo(
-            userid=row[0],
-            username=row[1],
-            givenname=row[2],
-            familyname=row[3],
-            is_admin=bool(row[4])
+            userid=current_user.userid,
+            username=current_user.username,
+            givenname=givenname,
+            familyname=familyname,
+            is_admin=bool(is_admin)
         )
         
     except HTTPException:
@@ -270,39 +349,24 @@ async def get_me(current_user: UserInfo = Depends(get_current_user)):
     except Exception as err:
         logging.error(f"get_me(): {err}")
         raise HTTPException(status_code=500, detail=str(err))
-    finally:
-        if dbCursor:
-            try:
-                dbCursor.close()
-            except:
-                pass
-        if dbConn:
-            try:
-                dbConn.close()
-            except:
-                pass
 
 
 @router.post("/set-password")
-async def set_password_for_existing_user(username: str, password: str):
+def set_password_for_existing_user(username: str, password: str):
     """
     Set password for existing users who don't have one
     This is an admin utility endpoint
     """
-    dbConn = None
-    dbCursor = None
-    
     try:
-        dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
-        
         password_hash = hash_password(password)
         
-        sql = "UPDATE users SET password_hash = %s WHERE username = %s"
-        dbCursor.execute(sql, [password_hash, username])
-        dbConn.commit()
+        with get_db_cursor() as (dbConn, dbCursor):
+            sql = "UPDATE users SET password_hash = %s WHERE username = %s"
+            dbCursor.execute(sql, [password_hash, username])
+            dbConn.commit()
+            updated = dbCursor.rowcount
         
-        if dbCursor.rowcount == 0:
+        if updated == 0:
             raise HTTPException(status_code=404, detail="User not found")
         
         return {"message": f"Password set for user {username}"}
@@ -312,14 +376,3 @@ async def set_password_for_existing_user(username: str, password: str):
     except Exception as err:
         logging.error(f"set_password(): {err}")
         raise HTTPException(status_code=500, detail=str(err))
-    finally:
-        if dbCursor:
-            try:
-                dbCursor.close()
-            except:
-                pass
-        if dbConn:
-            try:
-                dbConn.close()
-            except:
-                pass
@@ -3,49 +3,155 @@ Image editing routes
 Integrates ImageLab functionality with PhotoApp's storage system
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from typing import Optional
-from PIL import Image as PILImage
+from PIL import Image as PILImage, ImageOps
 from io import BytesIO
+import asyncio
 import logging
+import os
+import numpy as np
 
 from image_processing import Image, Pixel
-from aws_services import get_bucket, get_rekognition
-from database import get_dbConn
+from aws_services import get_s3, get_rekognition, S3_BUCKET_NAME, S3_TRANSFER_CONFIG
+from database import get_db_cursor
 
 router = APIRouter()
 
+# Transformations are CPU-bound, so run at most one per core at a time
+_TRANSFORM_SLOTS = asyncio.Semaphore(os.cpu_count() or 1)
+
+# Size of each chunk written to the client when streaming a result
+_RESPONSE_CHUNK_SIZE = 256 * 1024
+
+# How /apply runs each action on the internal image; p holds the form fields
+ACTION_HANDLERS = {
+    "resize": lambda img, p: img.resize(int(p["resize_width"]), int(p["resize_height"])),
+    "add_color": lambda img, p: img.add_color(Pixel(int(p["r"] or 0), int(p["g"] or 0), int(p["b"] or 0))),
+    "red_shift": lambda img, p: img.red_shift(float(p["amount"] or 0)),
+    "green_shift": lambda img, p: img.green_shift(float(p["amount"] or 0)),
+    "blue_shift": lambda img, p: img.blue_shift(float(p["amount"] or 0)),
+    "shift_brightness": lambda img, p: img.shift_brightness(float(p["factor"] or 1.0)),
+    "make_monochrome": lambda img, p: img.make_monochrome(),
+    "mirror_horizontal": lambda img, p: img.mirror_horizontal(),
+    "mirror_vertical": lambda img, p: img.mirror_vertical(),
+    "tile": lambda img, p: img.tile(int(p["size"] or 1)),
+    "blur": lambda img, p: img.blur(),
+    "negative": lambda img, p: img.negative(),
+    "sepia": lambda img, p: img.sepia(),
+    "rotate": lambda img, p: img.rotate(int(p["degrees"] or 90)),
+    "pixelate": lambda img, p: img.pixelate(int(p["block"] or 8)),
+}
+
+# PIL transposes for one, two and three clockwise quarter turns
+_CLOCKWISE_TRANSPOSES = {
+    1: PILImage.Transpose.ROTATE_270,
+    2: PILImage.Transpose.ROTATE_180,
+    3: PILImage.Transpose.ROTATE_90,
+}
+
+
+def _pil_rotate(pil_img: PILImage.Image, degrees: int) -> PILImage.Image:
+    """Rotate clockwise in 90 degree steps, matching Image.rotate"""
+    if degrees % 90 != 0:
+        raise ValueError("Rotation only supports multiples of 90 degrees")
+    steps_cw = (degrees // 90) % 4
+    if steps_cw == 0:
+        return pil_img
+    return pil_img.transpose(_CLOCKWISE_TRANSPOSES[steps_cw])
+
+
+# Actions Pillow performs in C with exactly the same output as the internal
+# Image, so they skip the ndarray round-trip; each returns a new PIL image
+PIL_ACTION_HANDLERS = {
+    "resize": lambda pil, p: pil.resize((int(p["resize_width"]), int(p["resize_height"])), PILImage.LANCZOS),
+    "mirror_horizontal": lambda pil, p: pil.transpose(PILImage.Transpose.FLIP_TOP_BOTTOM),
+    "mirror_vertical": lambda pil, p: pil.transpose(PILImage.Transpose.FLIP_LEFT_RIGHT),
+    "negative": lambda pil, p: ImageOps.invert(pil),
+    "rotate": lambda pil, p: _pil_rotate(pil, int(p["degrees"] or 90)),
+}
+
+# Every action /apply understands; checked before any image is fetched
+SUPPORTED_ACTIONS = frozenset(ACTION_HANDLERS)
+
+# Actions that work pixel by pixel, so they give the same look on a smaller copy
+POINTWISE_ACTIONS = frozenset({
+    "add_color", "red_shift", "green_shift", "blue_shift",
+    "shift_brightness", "make_monochrome", "negative", "sepia",
+})
+
 
 def pil_to_internal(pil_img: PILImage.Image) -> Image:
     """Convert PIL Image to internal Image format"""
-    pil_img = pil_img.convert("RGB")
-    width, height = pil_img.size
-    data = []
-    for r in range(height):
-        y = height - 1 - r
-        row = []
-        for x in range(width):
-            r8, g8, b8 = pil_img.getpixel((x, y))
-            row.append(Pixel(r8, g8, b8))
-        data.append(row)
-    return Image(data, [3779, 3779])
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+    # Internal images share PIL's top-down row order, so one copy is enough
+    return Image(np.array(pil_img), [3779, 3779])
 
 
 def internal_to_pil(img: Image) -> PILImage.Image:
     """Convert internal Image format to PIL Image"""
-    h = len(img._data)
-    w = len(img._data[0])
-    pil = PILImage.new("RGB", (w, h))
-    for r, row in enumerate(img._data):
-        y = h - 1 - r
-        for x, p in enumerate(row):
-            pil.putpixel((x, y), (p._red, p._green, p._blue))
-    return pil
+    return PILImage.fromarray(np.ascontiguousarray(img._data))
+
+
+# Encodings a client can ask for by name with the output_format field
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def pick_output_format(accept: Optional[str]) -> tuple[str, str]:
+    """
+    Choose the encoding for a transformed image from the Accept header
+
+    WebP or JPEG is only used when the client explicitly lists it, since
+    edits are re-applied to the returned image and lossy formats would
+    compound artifacts for clients that did not ask for them
+    
+    Returns:
+        tuple: (PIL format name, media type)
+    """
+    accepted = set()
+    for part in (accept or "").split(","):
+        fields = [f.strip() for f in part.split(";")]
+        media_type = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+        if q > 0:
+            accepted.add(media_type)
+
+    if "image/webp" in accepted:
+        return "WEBP", "image/webp"
+    if "image/jpeg" in accepted:
+        return "JPEG", "image/jpeg"
+    return "PNG", "image/png"
+
+
+async def _delete_quietly(bucketkey: str):
+    """
+    Best-effort delete of an S3 object that nothing references anymore
+
+    Failures are logged rather than raised, so they can only leave an
+    orphaned object behind, never fail a request that otherwise succeeded
+    """
+    try:
+        await run_in_threadpool(get_s3().delete_object, Bucket=S3_BUCKET_NAME, Key=bucketkey)
+    except Exception as e:
+        logging.error(f"Error deleting orphaned object {bucketkey}: {e}")
 
 
 @router.post("/apply")
 async def apply_transformation(
+    request: Request,
     file: Optional[UploadFile] = File(None),
     assetid: Optional[int] = Form(None),
     action: str = Form(...),
@@ -62,6 +168,8 @@ async def apply_transformation(
     height: Optional[int] = Form(None),
     resize_width: Optional[int] = Form(None),
     resize_height: Optional[int] = Form(None),
+    max_edge: Optional[int] = Form(None),
+    output_format: Optional[str] = Form(None),
 ):
     """
     Apply an image transformation
@@ -70,33 +178,52 @@ async def apply_transformation(
     - Uploaded file (file parameter)
     - Database by assetid (assetid parameter)
     
-    Returns the transformed image as PNG
+    For pointwise actions, max_edge optionally caps the longest side of
+    the input so large photos can be previewed without a full decode
+    
+    Returns the transformed image as PNG, or as WebP/JPEG when the
+    Accept header explicitly lists one of them; output_format ("png",
+    "jpeg" or "webp") overrides the header for clients that cannot set it
     """
     
+    # Reject bad requests before paying for the download and decode
+    if action not in SUPPORTED_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action '{action}'")
+    if action == "resize" and (not resize_width or not resize_height):
+        raise HTTPException(status_code=400, detail="Width and height required for resize")
+    if output_format and output_format.lower() not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown output format '{output_format}'")
+    if max_edge is not None and max_edge < 1:
+        raise HTTPException(status_code=400, detail="max_edge must be at least 1")
+    
+    handler = ACTION_HANDLERS[action]
+    params = {
+        "amount": amount, "factor": factor, "size": size,
+        "r": r, "g": g, "b": b, "degrees": degrees, "block": block,
+        "resize_width": resize_width, "resize_height": resize_height,
+    }
+    
     # Load image from either upload or database
     if assetid:
         # Load from S3 via database
         try:
-            bucket = get_bucket()
-            dbConn = get_dbConn()
-            dbCursor = dbConn.cursor()
-            
-            sql = "SELECT bucketkey FROM assets WHERE assetid = %s"
-            dbCursor.execute(sql, [assetid])
-            row = dbCursor.fetchone()
+            s3 = get_s3()
+            with get_db_cursor() as (dbConn, dbCursor):
+                sql = "SELECT bucketkey FROM assets WHERE assetid = %s LIMIT 1"
+                dbCursor.execute(sql, [assetid])
+                row = dbCursor.fetchone()
             
             if not row:
                 raise HTTPException(status_code=404, detail=f"Asset {assetid} not found")
             
             bucketkey = row[0]
             
-            # Download from S3
-            response = bucket.Object(bucketkey).get()
-            raw = response['Body'].read()
-            pil_in = PILImage.open(BytesIO(raw))
-            
-            dbCursor.close()
-            dbConn.close()
+            # Download from S3 straight into the buffer PIL decodes from,
+            # off the event loop
+            body = BytesIO()
+            await run_in_threadpool(s3.download_fileobj, S3_BUCKET_NAME, bucketkey, body, Config=S3_TRANSFER_CONFIG)
+            body.seek(0)
+            pil_in = PILImage.open(body)
             
         except HTTPException:
             raise
@@ -108,62 +235,60 @@ async def apply_transformation(
         if not file:
             raise HTTPException(status_code=400, detail="Image file or assetid required")
         try:
-            raw = await file.read()
-            pil_in = PILImage.open(BytesIO(raw))
+            # The upload is already spooled to a seekable file, so decode
+            # from it directly instead of copying it into memory first
+            await file.seek(0)
+            pil_in = PILImage.open(file.file)
         except Exception:
             raise HTTPException(status_code=400, detail="Could not read image")
 
-    # Convert to internal format
-    img = pil_to_internal(pil_in)
+    def transform() -> BytesIO:
+        """Decode, transform and re-encode the image in a worker thread"""
+        # Apply transformation
+        try:
+            # Let libjpeg decode large JPEGs at a reduced scale when the
+            # full resolution would be thrown away anyway (no-op for other formats)
+            if action == "resize":
+                pil_in.draft("RGB", (int(resize_width) * 2, int(resize_height) * 2))
+            elif max_edge and action in POINTWISE_ACTIONS:
+                # thumbnail() drafts internally and leaves smaller images alone
+                pil_in.thumbnail((max_edge, max_edge), PILImage.LANCZOS)
 
-    # Apply transformation
-    try:
-        if action == "resize":
-            if not resize_width or not resize_height:
-                raise HTTPException(status_code=400, detail="Width and height required for resize")
-            img.resize(int(resize_width), int(resize_height))
-        elif action == "add_color":
-            img.add_color(Pixel(int(r or 0), int(g or 0), int(b or 0)))
-        elif action == "red_shift":
-            img.red_shift(float(amount or 0))
-        elif action == "green_shift":
-            img.green_shift(float(amount or 0))
-        elif action == "blue_shift":
-            img.blue_shift(float(amount or 0))
-        elif action == "shift_brightness":
-            img.shift_brightness(float(factor or 1.0))
-        elif action == "make_monochrome":
-            img.make_monochrome()
-        elif action == "mirror_horizontal":
-            img.mirror_horizontal()
-        elif action == "mirror_vertical":
-            img.mirror_vertical()
-        elif action == "tile":
-            img.tile(int(size or 1))
-        elif action == "blur":
-            img.blur()
-        elif action == "negative":
-            img.negative()
-        elif action == "sepia":
-            img.sepia()
-        elif action == "rotate":
-            img.rotate(int(degrees or 90))
-        elif action == "pixelate":
-            img.pixelate(int(block or 8))
+            pil_handler = PIL_ACTION_HANDLERS.get(action)
+            if pil_handler:
+                rgb_in = pil_in if pil_in.mode == "RGB" else pil_in.convert("RGB")
+                pil_out = pil_handler(rgb_in, params)
+            else:
+                # Convert to internal format and back
+                img = pil_to_internal(pil_in)
+                handler(img, params)
+                pil_out = internal_to_pil(img)
+        except Exception as e:
+            logging.error(f"Error applying transformation: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        # The response is a preview, so favor encode speed over output size
+        buf = BytesIO()
+        if out_format == "WEBP":
+            pil_out.save(buf, format="WEBP", quality=85, method=0)
+        elif out_format == "JPEG":
+            pil_out.save(buf, format="JPEG", quality=85, subsampling=2, optimize=False)
         else:
-            raise HTTPException(status_code=400, detail=f"Unknown action '{action}'")
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Error applying transformation: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+            pil_out.save(buf, format="PNG", compress_level=1)
+        buf.seek(0)
+        return buf
 
-    # Convert back to PIL and return
-    pil_out = internal_to_pil(img)
-    buf = BytesIO()
-    pil_out.save(buf, format="PNG")
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+    if output_format:
+        out_format, media_type = OUTPUT_FORMATS[output_format.lower()]
+    else:
+        out_format, media_type = pick_output_format(request.headers.get("accept"))
+
+    # Keep the event loop free while the pixels are being crunched
+    async with _TRANSFORM_SLOTS:
+        buf = await run_in_threadpool(transform)
+    # Iterating a BytesIO directly yields it line by line, so send fixed-size chunks
+    chunks = iter(lambda: buf.read(_RESPONSE_CHUNK_SIZE), b"")
+    return StreamingResponse(chunks, media_type=media_type)
 
 
 @router.post("/save")
@@ -181,71 +306,46 @@ async def save_edited_image(
     Returns the assetid
     """
     import uuid
-    import os
     
     if replace_assetid:
         # Replace mode: Update existing asset
         try:
-            bucket = get_bucket()
-            dbConn = get_dbConn()
-            dbCursor = dbConn.cursor()
-            
-            # Verify asset exists and belongs to user
-            sql = "SELECT bucketkey, localname FROM assets WHERE assetid = %s AND userid = %s"
-            dbCursor.execute(sql, [replace_assetid, userid])
-            row = dbCursor.fetchone()
+            s3 = get_s3()
+            with get_db_cursor() as (dbConn, dbCursor):
+                # Verify asset exists and belongs to user, and fetch the
+                # username for the new bucketkey path in the same query
+                sql = """
+                    SELECT assets.bucketkey, users.username
+                    FROM assets
+                    JOIN users ON users.userid = assets.userid
+                    WHERE assets.assetid = %s AND assets.userid = %s
+                    LIMIT 1
+                """
+                dbCursor.execute(sql, [replace_assetid, userid])
+                row = dbCursor.fetchone()
             
             if not row:
-                dbCursor.close()
-                dbConn.close()
                 raise HTTPException(status_code=404, detail="Asset not found or access denied")
             
-            old_bucketkey = row[0]
-            
-            # Get username for new bucketkey path
-            sql = "SELECT username FROM users WHERE userid = %s"
-            dbCursor.execute(sql, [userid])
-            user_row = dbCursor.fetchone()
-            if not user_row:
-                dbCursor.close()
-                dbConn.close()
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            username = user_row[0]
+            old_bucketkey, username = row
             
             # Upload new image to S3
             unique_part = str(uuid.uuid4())
             new_bucketkey = f"{username}/{unique_part}-{file.filename}"
             
-            # Save file temporarily
-            temp_filename = f"temp_{unique_part}_{file.filename}"
-            with open(temp_filename, "wb") as f:
-                content = await file.read()
-                f.write(content)
+            # Upload new image, streaming the upload straight to S3; the
+            # S3 and Rekognition calls run without holding a DB connection
+            await file.seek(0)
+            await run_in_threadpool(s3.upload_fileobj, file.file, S3_BUCKET_NAME, new_bucketkey, Config=S3_TRANSFER_CONFIG)
             
             try:
-                # Upload new image
-                bucket.upload_file(temp_filename, new_bucketkey)
-                
-                # Delete old image from S3
-                bucket.Object(old_bucketkey).delete()
-                
-                # Update database record
-                sql = "UPDATE assets SET bucketkey = %s, localname = %s WHERE assetid = %s"
-                dbCursor.execute(sql, [new_bucketkey, file.filename, replace_assetid])
-                dbConn.commit()
-                
-                # Delete old labels
-                sql = "DELETE FROM image_labels WHERE assetid = %s"
-                dbCursor.execute(sql, [replace_assetid])
-                dbConn.commit()
-                
-                # Run Rekognition on new image
+                # Run Rekognition on the new image
                 rekognition = get_rekognition()
-                response = rekognition.detect_labels(
+                response = await run_in_threadpool(
+                    rekognition.detect_labels,
                     Image={
                         'S3Object': {
-                            'Bucket': bucket.name,
+                            'Bucket': S3_BUCKET_NAME,
                             'Name': new_bucketkey,
                         },
                     },
@@ -254,25 +354,32 @@ async def save_edited_image(
                 )
                 labels = response['Labels']
                 
-                # Store new labels
-                for label in labels:
-                    name = label['Name']
-                    confidence = int(label['Confidence'])
-                    sql = "INSERT INTO image_labels (assetid, label, confidence) VALUES (%s, %s, %s)"
-                    dbCursor.execute(sql, [replace_assetid, name, confidence])
-                
-                dbConn.commit()
-                
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
+                with get_db_cursor() as (dbConn, dbCursor):
+                    # Point the asset at the new image and swap its labels
+                    # in a single transaction, committed once at the end
+                    sql = "UPDATE assets SET bucketkey = %s, localname = %s WHERE assetid = %s"
+                    dbCursor.execute(sql, [new_bucketkey, file.filename, replace_assetid])
+                    
+                    sql = "DELETE FROM image_labels WHERE assetid = %s"
+                    dbCursor.execute(sql, [replace_assetid])
+                    
+                    rows = [(replace_assetid, label['Name'], int(label['Confidence'])) for label in labels]
+                    if rows:
+                        sql = "INSERT INTO image_labels (assetid, label, confidence) VALUES (%s, %s, %s)"
+                        dbCursor.executemany(sql, rows)
+                    
+                    dbConn.commit()
+            except Exception:
+                # The asset still points at the old image; drop the new one
+                await _delete_quietly(new_bucketkey)
+                raise
             
-            dbCursor.close()
-            dbConn.close()
+            # Only now that the asset points at the new image is it safe to
+            # delete the old one; a failure here just leaves an orphan
+            await _delete_quietly(old_bucketkey)
             
             return {"assetid": replace_assetid, "message": "Image replaced successfully"}
-            
+        
         except HTTPException:
             raise
         except Exception as e:
@@ -283,7 +390,7 @@ async def save_edited_image(
         # New image mode: Use existing upload logic
         try:
             from routes.images import post_image
-            result = await post_image(userid=userid, file=file)
+            result = await run_in_threadpool(post_image, userid=userid, file=file)
             return result
         except HTTPException:
             raise
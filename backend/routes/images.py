@@ -3,31 +3,89 @@ Image routes
 Migrated from photoapp.py: get_images, post_image, get_image, delete_images functions
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from typing import List, Optional
 import logging
 import uuid
-import os
 import io
+import os
 import hashlib
+import pymysql
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from tenacity import retry, stop_after_attempt, wait_exponential
 from PIL import Image as PILImage
 
 from models import Image, ImageUploadResponse, DeleteResponse
-from database import get_dbConn
-from aws_services import get_bucket, get_rekognition
+from database import get_dbConn, db_retry
+from aws_services import get_s3, get_rekognition, S3_BUCKET_NAME, S3_TRANSFER_CONFIG
 
 router = APIRouter()
 
-# Simple in-memory cache for thumbnails (max 100 items)
-_thumbnail_cache = {}
+# S3 accepts at most 1000 keys per delete_objects request
+_S3_DELETE_BATCH_SIZE = 1000
+_S3_DELETE_WORKERS = 16
+
+# Largest image Rekognition accepts as inline bytes rather than an S3 object
+_REKOGNITION_MAX_BYTES = 5 * 1024 * 1024
+
+# Content types served for each image file extension
+_EXT_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+
+
+def _content_type(localname: str) -> str:
+    """Content type for an image based on its filename's extension"""
+    ext = os.path.splitext(localname)[1].lower()
+    return _EXT_CONTENT_TYPES.get(ext, "application/octet-stream")
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header lists etag (or is '*')"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+# Size of each chunk relayed from S3 to the client for full-size images
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_s3_body(body):
+    """
+    Yields an S3 object body in fixed-size chunks, closing it afterwards
+    even if the client disconnects partway, so its pooled connection
+    is released instead of being left half-read
+    """
+    try:
+        yield from body.iter_chunks(_DOWNLOAD_CHUNK_SIZE)
+    finally:
+        body.close()
+
+
+# In-memory LRU cache for thumbnails (max 100 items), keyed by assetid;
+# each entry keeps the bucketkey it was built from so a replaced image
+# is never served from a stale thumbnail
+_thumbnail_cache = OrderedDict()
+_thumbnail_cache_lock = threading.Lock()
 _THUMBNAIL_CACHE_MAX_SIZE = 100
 
 
 @router.get("/", response_model=List[Image])
-async def get_images(userid: Optional[int] = None):
+def get_images(userid: Optional[int] = None):
     """
     Returns a list of all images in the database, optionally filtered by userid.
     
@@ -46,11 +104,7 @@ async def get_images(userid: Optional[int] = None):
         HTTPException: If database error occurs
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def get_images_inner():
         dbConn = None
         dbCursor = None
@@ -58,23 +112,16 @@ async def get_images(userid: Optional[int] = None):
             dbConn = get_dbConn()
             dbCursor = dbConn.cursor()
             
-            if userid:
-                sql = """
-                    SELECT assets.assetid, users.userid, localname, bucketkey
-                    FROM users
-                    INNER JOIN assets ON users.userid = assets.userid
-                    WHERE users.userid = %s
-                    ORDER BY assets.assetid ASC
-                """
-                dbCursor.execute(sql, [userid])
-            else:
-                sql = """
-                    SELECT assets.assetid, users.userid, localname, bucketkey
-                    FROM users
-                    INNER JOIN assets ON users.userid = assets.userid
-                    ORDER BY assets.assetid ASC
-                """
-                dbCursor.execute(sql)
+            # A NULL filter matches every user, so one query covers both cases
+            filter_userid = userid or None
+            sql = """
+                SELECT assets.assetid, users.userid, localname, bucketkey
+                FROM users
+                INNER JOIN assets ON users.userid = assets.userid
+                WHERE (%s IS NULL OR users.userid = %s)
+                ORDER BY assets.assetid ASC
+            """
+            dbCursor.execute(sql, [filter_userid, filter_userid])
             
             rows = dbCursor.fetchall()
             return list(rows)
@@ -114,7 +161,7 @@ async def get_images(userid: Optional[int] = None):
 
 
 @router.post("/", response_model=ImageUploadResponse)
-async def post_image(
+def post_image(
     userid: int = Form(...),
     file: UploadFile = File(...)
 ):
@@ -137,27 +184,44 @@ async def post_image(
         HTTPException: If user doesn't exist or upload fails
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    def detect_labels(bucketkey, content=None):
+        """
+        Analyze the uploaded image with Rekognition, sending its bytes
+        inline when available so Rekognition need not read it from S3
+        """
+        if content is not None:
+            image = {'Bytes': content}
+        else:
+            image = {
+                'S3Object': {
+                    'Bucket': S3_BUCKET_NAME,
+                    'Name': bucketkey,
+                },
+            }
+        rekognition = get_rekognition()
+        response = rekognition.detect_labels(
+            Image=image,
+            MaxLabels=100,
+            MinConfidence=80,
+        )
+        return response['Labels']
+    
+    @db_retry
     def post_image_inner1():
-        """Verify user exists and get username"""
+        """Look up the username that prefixes the new bucketkey"""
         dbConn = None
         dbCursor = None
         try:
             dbConn = get_dbConn()
             dbCursor = dbConn.cursor()
             
-            sql = "SELECT username FROM users WHERE userid = %s"
+            sql = "SELECT username FROM users WHERE userid = %s LIMIT 1"
             dbCursor.execute(sql, [userid])
             row = dbCursor.fetchone()
             
-            if row:
-                return row[0]
-            else:
+            if not row:
                 raise ValueError("no such userid")
+            return row[0]
         
         except Exception as err:
             logging.error("post_image():")
@@ -176,13 +240,9 @@ async def post_image(
                 except:
                     pass
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
-    def post_image_inner2(bucketkey):
-        """Insert asset record and return asset_id"""
+    @db_retry
+    def post_image_inner2(bucketkey, labels):
+        """Insert the asset record and its labels in one transaction"""
         dbConn = None
         dbCursor = None
         try:
@@ -195,54 +255,29 @@ async def post_image(
             """
             dbCursor.execute(sql, [userid, file.filename, bucketkey])
             
-            sql = "SELECT LAST_INSERT_ID();"
-            dbCursor.execute(sql)
-            row = dbCursor.fetchone()
-            asset_id = row[0]
+            # The new assetid comes back with the INSERT's OK packet
+            asset_id = dbCursor.lastrowid
+            
+            label_rows = [
+                (asset_id, label['Name'], int(label['Confidence']))
+                for label in labels
+            ]
+            if label_rows:
+                sql = """
+                    INSERT INTO image_labels (assetid, label, confidence)
+                    VALUES(%s, %s, %s)
+                """
+                dbCursor.executemany(sql, label_rows)
             
             dbConn.commit()
             return asset_id
         
         except Exception as err:
-            dbConn.rollback()
-            logging.error("post_image():")
-            logging.error(str(err))
-            raise
-        
-        finally:
-            if dbCursor:
-                try:
-                    dbCursor.close()
-                except:
-                    pass
             if dbConn:
                 try:
-                    dbConn.close()
+                    dbConn.rollback()
                 except:
                     pass
-    
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
-    def post_image_inner3(asset_id, label_name, label_confidence):
-        """Insert image label"""
-        dbConn = None
-        dbCursor = None
-        try:
-            dbConn = get_dbConn()
-            dbCursor = dbConn.cursor()
-            
-            sql = """
-                INSERT INTO image_labels (assetid, label, confidence)
-                VALUES(%s, %s, %s)
-            """
-            dbCursor.execute(sql, [asset_id, label_name, label_confidence])
-            dbConn.commit()
-        
-        except Exception as err:
-            dbConn.rollback()
             logging.error("post_image():")
             logging.error(str(err))
             raise
@@ -263,46 +298,37 @@ async def post_image(
         # Step 1: Verify user exists
         username = post_image_inner1()
         
-        # Step 2: Upload to S3
-        bucket = get_bucket()
+        s3 = get_s3()
         unique_part = str(uuid.uuid4())
         bucketkey = f"{username}/{unique_part}-{file.filename}"
         
-        # Save file temporarily to upload to S3
-        temp_filename = f"temp_{unique_part}_{file.filename}"
-        with open(temp_filename, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        try:
-            bucket.upload_file(temp_filename, bucketkey)
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-        
-        # Step 3: Insert database record
-        asset_id = post_image_inner2(bucketkey)
-        
-        # Step 4: Analyze with Rekognition
-        rekognition = get_rekognition()
-        response = rekognition.detect_labels(
-            Image={
-                'S3Object': {
-                    'Bucket': bucket.name,
-                    'Name': bucketkey,
-                },
-            },
-            MaxLabels=100,
-            MinConfidence=80,
-        )
-        labels = response['Labels']
+        # Small images go to Rekognition inline; larger ones are read from S3
+        content = None
+        file.file.seek(0, os.SEEK_END)
+        if file.file.tell() <= _REKOGNITION_MAX_BYTES:
+            file.file.seek(0)
+            content = file.file.read()
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # Inline bytes don't need the S3 object, so Rekognition can
+            # run alongside the upload instead of after it
+            if content is not None:
+                labels_future = executor.submit(detect_labels, bucketkey, content)
+            
+            # Step 2: Stream the upload straight to S3 without a temp file;
+            # no database connection is held during the transfer
+            file.file.seek(0)
+            s3.upload_fileobj(file.file, S3_BUCKET_NAME, bucketkey, Config=S3_TRANSFER_CONFIG)
+            
+            # Step 3: Analyze the image with Rekognition
+            if content is None:
+                labels = detect_labels(bucketkey)
+            else:
+                labels = labels_future.result()
         
-        # Step 5: Store labels
-        for label in labels:
-            name = label['Name']
-            confidence = int(label['Confidence'])
-            post_image_inner3(asset_id, name, confidence)
+        # Steps 4-5: Insert the asset and its labels together, so a failed
+        # label insert can't leave an unlabeled asset behind
+        asset_id = post_image_inner2(bucketkey, labels)
         
         return ImageUploadResponse(
             assetid=asset_id,
@@ -318,12 +344,13 @@ async def post_image(
 
 
 @router.get("/{assetid}")
-async def get_image(assetid: int, thumbnail: bool = False, download: bool = False):
+def get_image(request: Request, assetid: int, thumbnail: bool = False, download: bool = False):
     """
     Downloads an image from S3 by assetid.
     
     Returns the image file as a streaming response.
     Optionally returns a thumbnail (max 400px width) for gallery view.
+    Answers 304 Not Modified when If-None-Match carries the current ETag.
     
     This endpoint preserves the exact logic from photoapp.py get_image()
     
@@ -338,11 +365,7 @@ async def get_image(assetid: int, thumbnail: bool = False, download: bool = Fals
         HTTPException: If assetid doesn't exist or download fails
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def get_image_inner():
         dbConn = None
         dbCursor = None
@@ -353,7 +376,8 @@ async def get_image(assetid: int, thumbnail: bool = False, download: bool = Fals
             sql = """
                 SELECT localname, bucketkey
                 FROM assets
-                WHERE assetid = %s;
+                WHERE assetid = %s
+                LIMIT 1;
             """
             dbCursor.execute(sql, [assetid])
             row = dbCursor.fetchone()
@@ -386,79 +410,103 @@ async def get_image(assetid: int, thumbnail: bool = False, download: bool = Fals
     try:
         localname, bucketkey = get_image_inner()
         
+        # Set cache headers for better performance
+        cache_max_age = 3600 if thumbnail else 86400  # 1 hour for thumbnails, 24 hours for full images
+        
+        # Every upload or replacement gets a new uuid-stamped bucketkey,
+        # so the key (plus which variant) identifies the bytes served
+        variant = "thumb" if thumbnail else "full"
+        etag = '"' + hashlib.md5(f"{variant}:{bucketkey}".encode()).hexdigest() + '"'
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(
+                status_code=304,
+                headers={
+                    "ETag": etag,
+                    "Cache-Control": f"public, max-age={cache_max_age}",
+                }
+            )
+        
         # If thumbnail requested, check cache first
         if thumbnail:
             cache_key = f"thumb_{assetid}"
-            if cache_key in _thumbnail_cache:
+            with _thumbnail_cache_lock:
+                cached = _thumbnail_cache.get(cache_key)
+                if cached is not None and cached[0] == bucketkey:
+                    # Mark the entry most recently used
+                    _thumbnail_cache.move_to_end(cache_key)
+            if cached is not None and cached[0] == bucketkey:
                 # Serve from cache
-                cached_data = _thumbnail_cache[cache_key]
-                buffer = io.BytesIO(cached_data)
+                buffer = io.BytesIO(cached[1])
                 content_type = "image/jpeg"
             else:
                 # Download from S3 and create thumbnail
-                bucket = get_bucket()
                 buffer = io.BytesIO()
-                bucket.download_fileobj(bucketkey, buffer)
+                get_s3().download_fileobj(S3_BUCKET_NAME, bucketkey, buffer, Config=S3_TRANSFER_CONFIG)
                 buffer.seek(0)
                 
                 try:
+                    # open() only parses the header; pixels are decoded on demand
                     img = PILImage.open(buffer)
-                    # Resize to max 300px width while maintaining aspect ratio
                     max_width = 300
-                    if img.width > max_width:
-                        ratio = max_width / img.width
-                        new_height = int(img.height * ratio)
-                        img = img.resize((max_width, new_height), PILImage.Resampling.LANCZOS)
-                    
-                    # Save resized image to new buffer with aggressive compression
-                    thumb_buffer = io.BytesIO()
-                    img = img.convert('RGB')  # Convert to RGB for JPEG
-                    img.save(thumb_buffer, format='JPEG', quality=70, optimize=True)
-                    thumb_data = thumb_buffer.getvalue()
+                    if img.width <= max_width and img.format == 'JPEG' and img.mode in ('RGB', 'L'):
+                        # Already a thumbnail-sized JPEG, so serve the stored
+                        # bytes as they are instead of decoding and re-encoding
+                        thumb_data = buffer.getvalue()
+                    else:
+                        # Resize to max 300px width while maintaining aspect ratio
+                        if img.width > max_width:
+                            ratio = max_width / img.width
+                            new_height = max(1, int(img.height * ratio))
+                            # Let libjpeg scale down while decoding (no-op for
+                            # other formats); what remains is under a 2x reduction
+                            img.draft('RGB', (max_width, new_height))
+                            img = img.resize((max_width, new_height), PILImage.Resampling.BILINEAR)
+                        
+                        # Save resized image to new buffer with aggressive compression;
+                        # optimize=True would add a second Huffman pass for ~2% smaller output
+                        thumb_buffer = io.BytesIO()
+                        img = img.convert('RGB')  # Convert to RGB for JPEG
+                        img.save(thumb_buffer, format='JPEG', quality=70)
+                        thumb_data = thumb_buffer.getvalue()
                     
                     # Store in cache (with size limit)
-                    if len(_thumbnail_cache) >= _THUMBNAIL_CACHE_MAX_SIZE:
-                        # Remove oldest entry
-                        oldest_key = next(iter(_thumbnail_cache))
-                        del _thumbnail_cache[oldest_key]
-                    _thumbnail_cache[cache_key] = thumb_data
+                    with _thumbnail_cache_lock:
+                        _thumbnail_cache.pop(cache_key, None)
+                        if len(_thumbnail_cache) >= _THUMBNAIL_CACHE_MAX_SIZE:
+                            # Remove least recently used entry
+                            _thumbnail_cache.popitem(last=False)
+                        _thumbnail_cache[cache_key] = (bucketkey, thumb_data)
                     
                     buffer = io.BytesIO(thumb_data)
                     content_type = "image/jpeg"
                 except Exception as e:
                     logging.warning(f"Failed to create thumbnail for {assetid}: {e}, serving original")
                     buffer.seek(0)
-                    content_type = "application/octet-stream"
-                    if localname.lower().endswith(('.jpg', '.jpeg')):
-                        content_type = "image/jpeg"
-                    elif localname.lower().endswith('.png'):
-                        content_type = "image/png"
+                    content_type = _content_type(localname)
         else:
-            # Download full image from S3
-            bucket = get_bucket()
-            buffer = io.BytesIO()
-            bucket.download_fileobj(bucketkey, buffer)
-            buffer.seek(0)
+            # Relay the full image from S3 chunk by chunk rather than
+            # buffering the whole object in memory first
+            obj = get_s3().get_object(Bucket=S3_BUCKET_NAME, Key=bucketkey)
+            buffer = _iter_s3_body(obj['Body'])
+            content_length = obj['ContentLength']
             
             # Determine content type from filename for full images
-            content_type = "application/octet-stream"
-            if localname.lower().endswith(('.jpg', '.jpeg')):
-                content_type = "image/jpeg"
-            elif localname.lower().endswith('.png'):
-                content_type = "image/png"
+            content_type = _content_type(localname)
         
-        # Set cache headers for better performance
-        cache_max_age = 3600 if thumbnail else 86400  # 1 hour for thumbnails, 24 hours for full images
         disposition = "inline" if thumbnail or not download else "attachment"
+        headers = {
+            "Content-Disposition": f"{disposition}; filename={localname}",
+            "Cache-Control": f"public, max-age={cache_max_age}",
+            "ETag": etag,
+            "X-Content-Type-Options": "nosniff",
+        }
+        if not thumbnail:
+            headers["Content-Length"] = str(content_length)
         
         return StreamingResponse(
             buffer,
             media_type=content_type,
-            headers={
-                "Content-Disposition": f"{disposition}; filename={localname}",
-                "Cache-Control": f"public, max-age={cache_max_age}",
-                "X-Content-Type-Options": "nosniff",
-            }
+            headers=headers
         )
     
     except ValueError as err:
@@ -470,7 +518,7 @@ async def get_image(assetid: int, thumbnail: bool = False, download: bool = Fals
 
 
 @router.delete("/", response_model=DeleteResponse)
-async def delete_images(userid: int | None = None):
+def delete_images(userid: int | None = None):
     """
     Deletes all images and associated labels from the database and S3.
     
@@ -489,11 +537,7 @@ async def delete_images(userid: int | None = None):
         HTTPException: If deletion fails
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def delete_images_inner1():
         """Get all bucketkeys to delete"""
         dbConn = None
@@ -501,7 +545,8 @@ async def delete_images(userid: int | None = None):
         objects_to_delete = []
         try:
             dbConn = get_dbConn()
-            dbCursor = dbConn.cursor()
+            # Unbuffered cursor: stream the keys instead of buffering every row
+            dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
             
             if userid is not None:
                 # Delete only images for specific user
@@ -512,9 +557,7 @@ async def delete_images(userid: int | None = None):
                 sql = "SELECT bucketkey FROM assets;"
                 dbCursor.execute(sql)
             
-            rows = dbCursor.fetchall()
-            
-            for row in rows:
+            for row in dbCursor:
                 objects_to_delete.append({'Key': str(row[0])})
             
             return objects_to_delete
@@ -536,11 +579,7 @@ async def delete_images(userid: int | None = None):
                 except:
                     pass
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def delete_images_inner2():
         """Clear database tables"""
         dbConn = None
@@ -563,14 +602,17 @@ async def delete_images(userid: int | None = None):
                 sql = "SET foreign_key_checks = 0;"
                 dbCursor.execute(sql)
                 
-                sql = "TRUNCATE TABLE assets;"
-                dbCursor.execute(sql)
-                
-                sql = "TRUNCATE TABLE image_labels;"
-                dbCursor.execute(sql)
-                
-                sql = "SET foreign_key_checks = 1;"
-                dbCursor.execute(sql)
+                # The session variable outlives this request on a pooled
+                # connection, so it must be restored even if a TRUNCATE fails
+                try:
+                    sql = "TRUNCATE TABLE assets;"
+                    dbCursor.execute(sql)
+                    
+                    sql = "TRUNCATE TABLE image_labels;"
+                    dbCursor.execute(sql)
+                finally:
+                    sql = "SET foreign_key_checks = 1;"
+                    dbCursor.execute(sql)
                 
                 sql = "ALTER TABLE assets AUTO_INCREMENT = 1001;"
                 dbCursor.execute(sql)
@@ -601,10 +643,29 @@ async def delete_images(userid: int | None = None):
         # Clear database
         delete_images_inner2()
         
-        # Delete from S3
+        # Delete from S3, in parallel batches of at most 1000 keys
         if len(objects_to_delete) > 0:
-            bucket = get_bucket()
-            bucket.delete_objects(Delete={'Objects': objects_to_delete})
+            s3 = get_s3()
+            batches = [
+                objects_to_delete[i:i + _S3_DELETE_BATCH_SIZE]
+                for i in range(0, len(objects_to_delete), _S3_DELETE_BATCH_SIZE)
+            ]
+            workers = min(_S3_DELETE_WORKERS, len(batches))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = list(executor.map(
+                    lambda batch: s3.delete_objects(
+                        Bucket=S3_BUCKET_NAME,
+                        Delete={'Objects': batch, 'Quiet': True}
+                    ),
+                    batches,
+                ))
+            
+            # Quiet mode still reports every key that could not be deleted
+            errors = [error for response in responses for error in response.get('Errors', [])]
+            if errors:
+                for error in errors:
+                    logging.error(f"delete_images(): could not delete {error['Key']}: {error['Message']}")
+                raise Exception(f"{len(errors)} of {len(objects_to_delete)} S3 objects could not be deleted")
         
         return DeleteResponse(
             success=True,
@@ -618,7 +679,7 @@ async def delete_images(userid: int | None = None):
 
 
 @router.delete("/{assetid}", response_model=DeleteResponse)
-async def delete_single_image(assetid: int):
+def delete_single_image(assetid: int):
     """
     Deletes a single image and its associated labels from the database and S3.
     
@@ -638,7 +699,7 @@ async def delete_single_image(assetid: int):
         dbCursor = dbConn.cursor()
         
         # Get image info
-        sql = "SELECT bucketkey FROM assets WHERE assetid = %s"
+        sql = "SELECT bucketkey FROM assets WHERE assetid = %s LIMIT 1"
         dbCursor.execute(sql, [assetid])
         row = dbCursor.fetchone()
         
@@ -658,13 +719,11 @@ async def delete_single_image(assetid: int):
         dbConn.commit()
         
         # Delete from S3
-        bucket = get_bucket()
-        bucket.delete_objects(Delete={'Objects': [{'Key': bucketkey}]})
+        get_s3().delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': [{'Key': bucketkey}]})
         
         # Clear from thumbnail cache
-        cache_key = f"thumb_{assetid}"
-        if cache_key in _thumbnail_cache:
-            del _thumbnail_cache[cache_key]
+        with _thumbnail_cache_lock:
+            _thumbnail_cache.pop(f"thumb_{assetid}", None)
         
         return DeleteResponse(
             success=True,
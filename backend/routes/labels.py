@@ -6,16 +6,15 @@ Migrated from photoapp.py: get_image_labels and get_images_with_label functions
 from fastapi import APIRouter, HTTPException
 from typing import List
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 from models import ImageLabel, ImageWithLabel
-from database import get_dbConn
+from database import get_dbConn, db_retry
 
 router = APIRouter()
 
 
 @router.get("/count")
-async def get_labels_count():
+def get_labels_count():
     """
     Returns the total count of all AI-detected labels in the database.
     
@@ -56,7 +55,7 @@ async def get_labels_count():
 
 
 @router.get("/image/{assetid}", response_model=List[ImageLabel])
-async def get_image_labels(assetid: int):
+def get_image_labels(assetid: int):
     """
     Retrieves AI-generated labels for a specific image.
     
@@ -75,11 +74,7 @@ async def get_image_labels(assetid: int):
         HTTPException: If assetid doesn't exist or database error occurs
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def get_image_labels_inner():
         dbConn = None
         dbCursor = None
@@ -87,18 +82,6 @@ async def get_image_labels(assetid: int):
             dbConn = get_dbConn()
             dbCursor = dbConn.cursor()
             
-            # First verify assetid exists
-            sql = """
-                SELECT assetid 
-                FROM assets
-                WHERE assetid = %s;
-            """
-            dbCursor.execute(sql, [assetid])
-            row = dbCursor.fetchone()
-            
-            if row is None:
-                raise ValueError("no such assetid")
-            
             # Get labels for this image
             sql = """
                 SELECT label, confidence
@@ -109,11 +92,14 @@ async def get_image_labels(assetid: int):
             dbCursor.execute(sql, [assetid])
             rows = dbCursor.fetchall()
             
-            image_labels = []
-            for row in rows:
-                image_labels.append((str(row[0]), int(row[1])))
+            # Only an empty result needs the extra check that assetid exists
+            if not rows:
+                sql = "SELECT 1 FROM assets WHERE assetid = %s LIMIT 1;"
+                dbCursor.execute(sql, [assetid])
+                if dbCursor.fetchone() is None:
+                    raise ValueError("no such assetid")
             
-            return image_labels
+            return rows
         
         except Exception as err:
             logging.error("get_image_labels():")
@@ -134,8 +120,10 @@ async def get_image_labels(assetid: int):
     
     try:
         labels_data = get_image_labels_inner()
+        # confidence is DECIMAL(5,2) in the database, so it is the one
+        # column that still needs converting to int
         labels = [
-            ImageLabel(label=label, confidence=confidence)
+            ImageLabel(label=label, confidence=int(confidence))
             for label, confidence in labels_data
         ]
         return labels
@@ -147,7 +135,7 @@ async def get_image_labels(assetid: int):
 
 
 @router.get("/search", response_model=List[ImageWithLabel])
-async def get_images_with_label(label: str, userid: int = None):
+def get_images_with_label(label: str, userid: int = None):
     """
     Searches for all images that contain a specific label (partial match).
     
@@ -168,11 +156,7 @@ async def get_images_with_label(label: str, userid: int = None):
         HTTPException: If database error occurs
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def get_images_with_label_inner():
         dbConn = None
         dbCursor = None
@@ -201,18 +185,7 @@ async def get_images_with_label(label: str, userid: int = None):
                 """
                 dbCursor.execute(sql, [search_pattern])
             
-            rows = dbCursor.fetchall()
-            
-            images = []
-            for row in rows:
-                images.append({
-                    "assetid": int(row[0]),
-                    "localname": str(row[1]),
-                    "label": str(row[2]),
-                    "confidence": int(row[3])
-                })
-            
-            return images
+            return dbCursor.fetchall()
         
         except Exception as err:
             logging.error("get_images_with_label():")
@@ -235,12 +208,12 @@ async def get_images_with_label(label: str, userid: int = None):
         images_data = get_images_with_label_inner()
         images = [
             ImageWithLabel(
-                assetid=item["assetid"],
-                localname=item["localname"],
-                label=item["label"],
-                confidence=item["confidence"]
+                assetid=assetid,
+                localname=localname,
+                label=label_name,
+                confidence=int(confidence)
             )
-            for item in images_data
+            for assetid, localname, label_name, confidence in images_data
         ]
         return images
     
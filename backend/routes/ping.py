@@ -5,17 +5,25 @@ Migrated from photoapp.py get_ping function
 
 from fastapi import APIRouter
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from models import PingResponse
-from database import get_dbConn
-from aws_services import get_bucket
+from database import get_dbConn, db_retry
+from aws_services import get_s3, S3_BUCKET_NAME
 
 router = APIRouter()
 
 
+# /ping is polled by health checks, so one result is shared for a few seconds
+_PING_CACHE_TTL_SECONDS = 5
+_ping_cache = None  # (expires_at, PingResponse)
+_ping_lock = threading.Lock()
+
+
 @router.get("/ping", response_model=PingResponse)
-async def get_ping():
+def get_ping():
     """
     Pings the S3 bucket and database server to check if they are accessible.
     
@@ -23,36 +31,41 @@ async def get_ping():
     - bucket_items: Number of items in the S3 bucket (or error message)
     - database_users: Number of users in the database (or error message)
     
-    This endpoint preserves the exact logic from photoapp.py get_ping()
+    This endpoint preserves the exact logic from photoapp.py get_ping(),
+    except that a result is reused for up to 5 seconds
     
     Returns:
         PingResponse: Status of S3 bucket and database
     """
+    global _ping_cache
+    
+    # Only one request refreshes at a time; concurrent ones wait and reuse it
+    with _ping_lock:
+        if _ping_cache is None or _ping_cache[0] <= time.monotonic():
+            response = _check_services()
+            _ping_cache = (time.monotonic() + _PING_CACHE_TTL_SECONDS, response)
+        return _ping_cache[1]
+
+
+def _check_services() -> PingResponse:
+    """Counts S3 objects and database users, each reported independently"""
     
     def get_M():
         """Get number of items in S3 bucket"""
-        bucket = None
         try:
-            bucket = get_bucket()
-            assets = bucket.objects.all()
-            M = len(list(assets))
+            s3 = get_s3()
+            # Sum each page's KeyCount rather than materializing every key
+            paginator = s3.get_paginator('list_objects_v2')
+            M = 0
+            for page in paginator.paginate(Bucket=S3_BUCKET_NAME):
+                M += page.get('KeyCount', 0)
             return M
         except Exception as err:
             logging.error("get_ping.get_M():")
             logging.error(str(err))
             raise
-        finally:
-            if bucket:
-                try:
-                    bucket.meta.client.close()
-                except:
-                    pass
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def get_N():
         """Get number of users in database"""
         dbConn = None
@@ -86,14 +99,19 @@ async def get_ping():
                 except:
                     pass
     
-    # Compute M and N separately for independent exception handling
+    # Count S3 objects and database users at the same time; the results
+    # are still collected separately for independent exception handling
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        M_future = executor.submit(get_M)
+        N_future = executor.submit(get_N)
+    
     try:
-        M = get_M()
+        M = M_future.result()
     except Exception as err:
         M = str(err)
     
     try:
-        N = get_N()
+        N = N_future.result()
     except Exception as err:
         N = str(err)
     
@@ -7,10 +7,12 @@ from fastapi import APIRouter, HTTPException
 from typing import List
 from pydantic import BaseModel
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
+import pymysql
+from pymysql.constants import ER
 
 from models import User
-from database import get_dbConn
+from routes.auth import hash_password
+from database import get_dbConn, db_retry
 
 router = APIRouter()
 
@@ -24,7 +26,7 @@ class CreateUserRequest(BaseModel):
 
 
 @router.get("/", response_model=List[User])
-async def get_users():
+def get_users():
     """
     Returns a list of all users in the database.
     
@@ -43,7 +45,9 @@ async def get_users():
     dbCursor = None
     try:
         dbConn = get_dbConn()
-        dbCursor = dbConn.cursor()
+        # Unbuffered cursor: build the models as rows arrive instead of
+        # holding every row and every model at once
+        dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
         
         sql = """
             SELECT userid, username, givenname, familyname, is_admin 
@@ -52,7 +56,6 @@ async def get_users():
         """
         
         dbCursor.execute(sql)
-        rows = dbCursor.fetchall()
         
         users = [
             User(
@@ -62,7 +65,7 @@ async def get_users():
                 familyname=row[3],
                 is_admin=bool(row[4])
             )
-            for row in rows
+            for row in dbCursor
         ]
         
         return users
@@ -86,7 +89,7 @@ async def get_users():
 
 
 @router.post("/", response_model=User, status_code=201)
-async def create_user(user_request: CreateUserRequest):
+def create_user(user_request: CreateUserRequest):
     """
     Creates a new user in the database.
     
@@ -100,11 +103,7 @@ async def create_user(user_request: CreateUserRequest):
         HTTPException: If username already exists or database error occurs
     """
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        reraise=True
-    )
+    @db_retry
     def create_user_inner():
         dbConn = None
         dbCursor = None
@@ -112,36 +111,29 @@ async def create_user(user_request: CreateUserRequest):
             dbConn = get_dbConn()
             dbCursor = dbConn.cursor()
             
-            # Check if username already exists
-            sql = "SELECT userid FROM users WHERE username = %s"
-            dbCursor.execute(sql, [user_request.username])
-            existing = dbCursor.fetchone()
-            
-            if existing:
-                raise ValueError(f"Username '{user_request.username}' already exists")
-            
             # Hash the password (same as auth.py)
-            import hashlib
-            salt = "imagelab-salt"
-            password_hash = hashlib.sha256(f"{salt}{user_request.password}".encode()).hexdigest()
+            password_hash = hash_password(user_request.password)
 
-            # Insert new user with password_hash
+            # Insert new user with password_hash; the unique index on
+            # username rejects duplicates, even between concurrent requests
             sql = """
                 INSERT INTO users (username, givenname, familyname, password_hash)
                 VALUES (%s, %s, %s, %s)
             """
-            dbCursor.execute(sql, [
-                user_request.username,
-                user_request.givenname,
-                user_request.familyname,
-                password_hash
-            ])
+            try:
+                dbCursor.execute(sql, [
+                    user_request.username,
+                    user_request.givenname,
+                    user_request.familyname,
+                    password_hash
+                ])
+            except pymysql.err.IntegrityError as err:
+                if err.args[0] == ER.DUP_ENTRY:
+                    raise ValueError(f"Username '{user_request.username}' already exists")
+                raise
             
-            # Get the new user ID
-            sql = "SELECT LAST_INSERT_ID()"
-            dbCursor.execute(sql)
-            row = dbCursor.fetchone()
-            new_userid = row[0]
+            # The new user ID comes back with the INSERT's OK packet
+            new_userid = dbCursor.lastrowid
             
             dbConn.commit()
             
@@ -183,7 +175,7 @@ async def create_user(user_request: CreateUserRequest):
         raise HTTPException(status_code=500, detail=str(err))
 
 @router.delete("/{userid}", status_code=200)
-async def delete_user(userid: int):
+def delete_user(userid: int):
     """
     Deletes a user and all their associated images and labels.
     
@@ -202,29 +194,23 @@ async def delete_user(userid: int):
         dbConn = get_dbConn()
         dbCursor = dbConn.cursor()
         
-        # Check if user exists
-        sql = "SELECT userid FROM users WHERE userid = %s"
-        dbCursor.execute(sql, [userid])
-        user = dbCursor.fetchone()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail=f"User with ID {userid} not found")
-        
         # Delete image labels for user's images
-        sql = """
-            DELETE FROM image_labels 
-            WHERE assetid IN (SELECT assetid FROM assets WHERE userid = %s)
-        """
+        sql = "DELETE il FROM image_labels il INNER JOIN assets a ON il.assetid = a.assetid WHERE a.userid = %s"
         dbCursor.execute(sql, [userid])
         
         # Delete user's images
         sql = "DELETE FROM assets WHERE userid = %s"
         dbCursor.execute(sql, [userid])
         
-        # Delete the user
+        # Delete the user; no row deleted means there was no such user,
+        # so the rollback leaves nothing behind
         sql = "DELETE FROM users WHERE userid = %s"
         dbCursor.execute(sql, [userid])
         
+        if dbCursor.rowcount == 0:
+            dbConn.rollback()
+            raise HTTPException(status_code=404, detail=f"User with ID {userid} not found")
+        
         dbConn.commit()
         
         return {"message": f"User {userid} and all associated data deleted successfully"}
@@ -8,11 +8,14 @@ import json
 
 BASE_URL = "http://localhost:8000"
 
+# One keep-alive connection is reused by every test instead of a new socket per call
+SESSION = requests.Session()
+
 
 def test_root():
     """Test root endpoint"""
     print("Testing root endpoint...")
-    response = requests.get(f"{BASE_URL}/")
+    response = SESSION.get(f"{BASE_URL}/")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}\n")
 
@@ -20,7 +23,7 @@ def test_root():
 def test_ping():
     """Test ping endpoint"""
     print("Testing ping endpoint...")
-    response = requests.get(f"{BASE_URL}/ping")
+    response = SESSION.get(f"{BASE_URL}/ping")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}\n")
 
@@ -28,7 +31,7 @@ def test_ping():
 def test_get_users():
     """Test get users endpoint"""
     print("Testing get users endpoint...")
-    response = requests.get(f"{BASE_URL}/users/")
+    response = SESSION.get(f"{BASE_URL}/users/")
     print(f"Status: {response.status_code}")
     users = response.json()
     print(f"Found {len(users)} users")
@@ -39,7 +42,7 @@ def test_get_users():
 def test_get_images():
     """Test get images endpoint"""
     print("Testing get images endpoint...")
-    response = requests.get(f"{BASE_URL}/images/")
+    response = SESSION.get(f"{BASE_URL}/images/")
     print(f"Status: {response.status_code}")
     images = response.json()
     print(f"Found {len(images)} images")
@@ -50,7 +53,7 @@ def test_get_images():
 def test_search_labels():
     """Test label search endpoint"""
     print("Testing label search endpoint...")
-    response = requests.get(f"{BASE_URL}/labels/search?label=person")
+    response = SESSION.get(f"{BASE_URL}/labels/search?label=person")
     print(f"Status: {response.status_code}")
     results = response.json()
     print(f"Found {len(results)} images with label 'person'")
@@ -75,3 +78,5 @@ if __name__ == "__main__":
         print("Make sure the server is running: python main.py")
     except Exception as e:
         print(f"ERROR: {e}")
+    finally:
+        SESSION.close()